@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+Benchmarks for the fitting-factor hot path.
+
+    fixtures                  synthetic NR-like HDF5 catalog, whitened
+                              reconstructions and ASD, generated locally
+    run_benchmarks            timed cases (generation, single-IFO / network
+                              match, fmin optimisation, catalog load) with
+                              results written to JSON
+    bench_match_kernel        snr_calc vs nrburst_kernel.match_kernel
+    bench_peak_interpolation  fmin iterations vs peak interpolation
+
+The repository root, nrburst_utils and pca_utils should be on the PYTHONPATH
+(see setup.sh).
+"""
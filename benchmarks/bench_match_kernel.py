@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+bench_match_kernel.py
+
+Micro-benchmark of the overlap calculation in single_ifo_match(): the
+pycbc-based nrburst_utils.snr_calc() path against nrburst_kernel.match_kernel.
+Reports the time per evaluation and the largest fractional difference in the
+(maxsnr, h_sigmasq, d_sigmasq) returned by the two.
+
+Usage:
+
+    bench_match_kernel.py [sample_rate] [datalen] [nevals]
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+import pycbc.types
+
+import nrburst_utils as nrbu
+import nrburst_kernel as nrbu_kernel
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+def chirp(times, t0, f0=30.0, fdot=60.0, width=0.3):
+    """
+    Gaussian-enveloped linear chirp peaking at t0; a stand-in for a whitened
+    burst reconstruction / template
+    """
+    return np.sin(2*np.pi*(f0 + fdot*(times-t0))*(times-t0)) * \
+            np.exp(-0.5*((times-t0)/width)**2)
+
+def snr_calc_path(tmplt, data, asd, delta_t):
+    """
+    The overlap as computed in single_ifo_match() without a kernel
+    """
+
+    tmplt = pycbc.types.TimeSeries(tmplt, delta_t=delta_t)
+    rec_data = pycbc.types.TimeSeries(data, delta_t=delta_t)
+
+    tlen = max(len(tmplt), len(rec_data))
+    tmplt.resize(tlen)
+    rec_data.resize(tlen)
+
+    Tmplt = tmplt.to_frequencyseries()
+    Tmplt.data /= asd
+
+    return nrbu.snr_calc(Tmplt, rec_data, f_min=30.)
+
+def main(sample_rate=1024, datalen=4.0, nevals=200):
+
+    delta_t = 1./sample_rate
+    N = int(datalen*sample_rate)
+    times = np.arange(N)*delta_t
+
+    rng = np.random.RandomState(0)
+    data = chirp(times, 0.5*datalen) + 0.1*rng.randn(N)
+    tmplts = [chirp(times, 0.5*datalen + shift) for shift in
+            rng.uniform(-0.2, 0.2, size=nevals)]
+
+    freqs = np.arange(N/2+1) / datalen
+    asd = 1.0 + (30.0/np.maximum(freqs, 1.0))**2
+
+    # --- Equivalence
+    kernel = nrbu_kernel.match_kernel(delta_t, f_min=30.0)
+
+    max_diff = 0.0
+    for tmplt in tmplts[:10]:
+        reference = np.array(snr_calc_path(tmplt, data, asd, delta_t))
+        result = np.array(kernel.whitened_snr(tmplt, data, asd))
+        max_diff = max(max_diff, max(abs(result-reference)/abs(reference)))
+
+    # --- Timing
+    then = timeit.time.time()
+    for tmplt in tmplts:
+        snr_calc_path(tmplt, data, asd, delta_t)
+    snr_calc_time = (timeit.time.time() - then) / nevals
+
+    kernel = nrbu_kernel.match_kernel(delta_t, f_min=30.0)
+    then = timeit.time.time()
+    for tmplt in tmplts:
+        kernel.whitened_snr(tmplt, data, asd)
+    kernel_time = (timeit.time.time() - then) / nevals
+
+    print >> sys.stdout, "N=%d, %d evaluations (pyfftw: %s)"%(N, nevals,
+            nrbu_kernel._have_fftw)
+    print >> sys.stdout, "snr_calc:     %.3e s / evaluation"%snr_calc_time
+    print >> sys.stdout, "match_kernel: %.3e s / evaluation (x%.1f)"%(
+            kernel_time, snr_calc_time/kernel_time)
+    print >> sys.stdout, "max fractional difference: %.2e"%max_diff
+
+    return snr_calc_time, kernel_time, max_diff
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]]
+    if len(args) > 0: args[0] = int(args[0])
+    if len(args) > 2: args[2] = int(args[2])
+    main(*args)
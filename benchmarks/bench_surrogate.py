@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+bench_surrogate.py
+
+Accuracy of the Chebyshev surrogate over mass
+(nrburst_fitfactor.surrogate_maximise) against the number of objective
+evaluations (i.e., waveform generations), compared with the Nelder-Mead
+(scipy.optimize.fmin) optimisation used by nrburst_netmatch.py.
+
+The toy templates and mismatch of bench_peak_interpolation.py stand in for the
+NR waveforms.  For each noisy injection and random starting point, fmin is
+run with the settings of nrburst_netmatch.py and the surrogate with several
+numbers of nodes; the mean number of evaluations, the mean fitting factor and
+the mean / worst shortfall of the fitting factor relative to fmin are
+reported.
+
+Usage:
+
+    bench_surrogate.py [ninjections] [nstarts]
+"""
+
+import sys
+
+import numpy as np
+import scipy.optimize
+
+import nrburst_kernel as nrbu_kernel
+import nrburst_fitfactor as nrbu_ff
+
+from bench_peak_interpolation import template, mismatch, sample_rate, \
+        datalen, delta_t
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+__surrogate_nodes__ = [4, 6, 8, 12]
+
+def main(ninjections=5, nstarts=4):
+
+    rng = np.random.RandomState(0)
+
+    N = int(datalen*sample_rate)
+    times = np.arange(N)*delta_t
+    asd = np.ones(N/2+1)
+    mass_bounds = (40.0, 120.0)
+
+    kernel = nrbu_kernel.match_kernel(delta_t, f_min=30.0,
+            peak_interpolation='quadratic')
+
+    # Injections and starting points
+    injections = []
+    for i in xrange(ninjections):
+        mass = rng.uniform(50, 100)
+        inclination = rng.uniform(0, 90)
+        tc = 0.5*datalen + rng.uniform(-0.1, 0.1)
+        data = template(times, mass, inclination, tc) + 0.05*rng.randn(N)
+        starts = [np.array([rng.uniform(*mass_bounds), rng.uniform(0, 90)])
+                for s in xrange(nstarts)]
+        injections.append((data, starts))
+
+    # --- Nelder-Mead
+    fmin_fevals = []
+    fmin_ff = []
+    for data, starts in injections:
+        for x0 in starts:
+            result = scipy.optimize.fmin(mismatch, x0=x0, args=(times, data,
+                asd, kernel, mass_bounds), xtol=1e-3, ftol=1e-3, maxfun=10000,
+                full_output=True, disp=False)
+            fmin_ff.append(1-result[1])
+            fmin_fevals.append(result[3])
+    fmin_ff = np.array(fmin_ff)
+
+    print >> sys.stdout, "%-10s %10s %10s %12s %12s"%("method", "fevals", "FF",
+            "mean dFF", "max dFF")
+    print >> sys.stdout, "%-10s %10.1f %10.4f %12s %12s"%("fmin",
+            np.mean(fmin_fevals), np.mean(fmin_ff), "-", "-")
+
+    results = {'fmin':(np.mean(fmin_fevals), np.mean(fmin_ff), 0.0, 0.0)}
+
+    # --- Surrogate
+    for nnodes in __surrogate_nodes__:
+
+        fevals = []
+        fitting_factors = []
+        for data, starts in injections:
+            for x0 in starts:
+                best, params, nevals = nrbu_ff.surrogate_maximise(mismatch,
+                        mass_bounds, args=(times, data, asd, kernel,
+                            mass_bounds), nnodes=nnodes, inclination=x0[1])
+                fitting_factors.append(1-best)
+                fevals.append(nevals)
+
+        shortfall = fmin_ff - np.array(fitting_factors)
+
+        label = "cheb%d"%nnodes
+        results[label] = (np.mean(fevals), np.mean(fitting_factors),
+                np.mean(shortfall), np.max(shortfall))
+
+        print >> sys.stdout, "%-10s %10.1f %10.4f %12.2e %12.2e"%(label,
+                np.mean(fevals), np.mean(fitting_factors), np.mean(shortfall),
+                np.max(shortfall))
+
+    return results
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
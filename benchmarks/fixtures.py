@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+fixtures.py
+
+Synthetic inputs for the benchmarks, generated locally so that no real NR
+catalog or reconstruction is needed:
+
+    - NR-like HDF5 files with the same layout as the GATech catalog files
+      (e.g., lib/GT0901.h5): the metadata attributes read by get_wf_pols and
+      gatech_cat_readme.py, and amp_l2_m*/phase_l2_m* spline groups (data,
+      deg, errors, knots, tol) for a toy inspiral-merger-ringdown in code
+      units
+    - a README.txt for the catalog in the format read by
+      nrburst_utils.simulation_details
+    - an analytic aLIGO-like ASD and whitened burst reconstructions (one
+      sample per row, as loaded by nrburst_netmatch.py)
+
+Usage:
+
+    fixtures.py <output directory>
+"""
+
+import sys, os
+
+import h5py
+import numpy as np
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Solar mass in seconds
+MTSUN_SI = 4.925491025543576e-06
+
+# Fixture catalog: (run, q, spin1z, spin2z, mres)
+__fixture_simulations__ = [
+        ('BENCH_D12_q1.00_a0.0_0.0', 1.0, 0.0, 0.0, 120),
+        ('BENCH_D12_q1.00_a0.0_0.0', 1.0, 0.0, 0.0, 140),
+        ('BENCH_D12_q1.50_a0.3_-0.3', 1.5, 0.3, -0.3, 140),
+        ('BENCH_D12_q2.00_a0.6_0.0', 2.0, 0.6, 0.0, 140),
+        ]
+
+def toy_imr(times, omega0=0.06, omega_peak=0.3, omega_ring=0.55,
+        tau_ring=12.0, amp_peak=0.4):
+    """
+    Amplitude and phase of a toy (2,2) mode in code units: a frequency
+    sweep up to the peak at t=0 followed by an exponentially damped ringdown
+    """
+
+    t_start = times[0]
+
+    # Inspiral frequency evolves as (1-t/tc)^(-3/8) between omega0 and
+    # omega_peak
+    ratio = (omega0/omega_peak)**(8./3)
+    tc = -ratio * t_start / (1 - ratio)
+    with np.errstate(invalid='ignore'):
+        omega = np.where(times < 0,
+                omega0 * ((tc - times)/(tc - t_start))**(-3./8), omega_ring)
+
+    amp = np.where(times < 0, amp_peak * (omega/omega_peak)**(2./3),
+            amp_peak * np.exp(-times/tau_ring))
+
+    phase = -np.concatenate(([0.0], np.cumsum(0.5*(omega[1:]+omega[:-1]) *
+        np.diff(times))))
+
+    return amp, phase, omega
+
+def make_nr_fixture(filename, run='BENCH_D12_q1.00_a0.0_0.0', q=1.0,
+        spin1z=0.0, spin2z=0.0, mres=140, duration=2000.0, knot_spacing=4.0):
+    """
+    Write an NR-like HDF5 file to filename for a simulation with mass ratio
+    q and aligned spins (spin1z, spin2z)
+    """
+
+    mass1 = q / (1.0 + q)
+    mass2 = 1.0 / (1.0 + q)
+    eta = mass1*mass2
+
+    knots = np.arange(-duration, 100.0+knot_spacing, knot_spacing)
+    amp, phase, omega = toy_imr(knots)
+
+    # Higher resolutions differ slightly, for convergence tests
+    phase *= 1.0 + 1e-4*(140.0 - mres)/20.0
+
+    f = h5py.File(filename, 'w')
+
+    f.attrs['NR_group'] = 'BENCH'
+    f.attrs['PN_approximant'] = 'none'
+    f.attrs['coa_phase'] = 0.0
+    f.attrs['eta'] = eta
+    f.attrs['f_lower_at_1MSUN'] = omega[0] / (2*np.pi*MTSUN_SI)
+    f.attrs['hashtag'] = 'Waveforms/BENCH-series/%s_m%d/'%(run, mres)
+    f.attrs['mass1'] = mass1
+    f.attrs['mass2'] = mass2
+    f.attrs['name'] = 'BENCH:BBH:%s_m%d'%(run, mres)
+    f.attrs['spin1x'] = 0.0
+    f.attrs['spin1y'] = 0.0
+    f.attrs['spin1z'] = spin1z
+    f.attrs['spin2x'] = 0.0
+    f.attrs['spin2y'] = 0.0
+    f.attrs['spin2z'] = spin2z
+    f.attrs['type'] = 'qNaN'
+
+    f.create_dataset('HybridTimes', data=np.zeros(shape=(1, len(knots))))
+
+    # l=2 modes; the m=+/-2 modes carry the signal, the others are small
+    for m in [-2, -1, 0, 1, 2]:
+        scale = 1.0 if abs(m) == 2 else 1e-3
+        mode_phase = 0.5*abs(m)*phase if m != 0 else np.zeros(len(knots))
+        for name, data in [('amp', scale*amp), ('phase', mode_phase)]:
+            group = f.create_group('%s_l2_m%d'%(name, m))
+            group.create_dataset('data', data=data)
+            group.create_dataset('deg', data=5)
+            group.create_dataset('errors', data=np.zeros(len(knots)-6))
+            group.create_dataset('knots', data=knots)
+            group.create_dataset('tol', data=1e-6)
+
+    f.close()
+
+    return filename
+
+def _readme_params(filename):
+    """
+    README.txt parameters for the fixture filename (see gatech_cat_readme.py)
+    """
+
+    f = h5py.File(filename, 'r')
+    params = dict([(attr, float(f.attrs[attr])) for attr in ['eta', 'spin1x',
+        'spin1y', 'spin1z', 'spin2x', 'spin2y', 'spin2z']])
+    params['Mmin30Hz'] = float(f.attrs['f_lower_at_1MSUN']) / 30.0
+    params['q'] = float(f.attrs['mass1']) / float(f.attrs['mass2'])
+    f.close()
+
+    params['Mchirpmin30Hz'] = params['Mmin30Hz'] * params['eta']**(3./5)
+    params['a1'] = np.linalg.norm([params['spin1x'], params['spin1y'],
+        params['spin1z']])
+    params['a2'] = np.linalg.norm([params['spin2x'], params['spin2y'],
+        params['spin2z']])
+
+    return params
+
+def make_catalog(catdir, simulations=__fixture_simulations__):
+    """
+    Write a fixture catalog (HDF5 files and README.txt) to catdir and return
+    the list of HDF5 files
+    """
+
+    if not os.path.exists(catdir):
+        os.makedirs(catdir)
+
+    wavefiles = []
+    for s, (run, q, spin1z, spin2z, mres) in enumerate(simulations):
+        filename = os.path.join(catdir, 'BENCH%04d.h5'%(s+1))
+        make_nr_fixture(filename, run=run, q=q, spin1z=spin1z,
+                spin2z=spin2z, mres=mres)
+        wavefiles.append(filename)
+
+    param_list = [_readme_params(wavefile) for wavefile in wavefiles]
+    keys = sorted(param_list[0].keys())
+
+    f = open(os.path.join(catdir, 'README.txt'), 'w')
+    f.write('# runID wavefile %s\n'%(' '.join(keys)))
+    for s, params in enumerate(param_list):
+        f.write('%d %s %s\n'%(s+1, wavefiles[s], ' '.join(['%f'%params[key]
+            for key in keys])))
+    f.close()
+
+    return wavefiles
+
+def aligo_asd(frequencies):
+    """
+    Analytic approximation to the aLIGO design ASD (1/sqrt(Hz))
+    """
+    x = np.maximum(frequencies, 1.0) / 215.0
+    return 1e-23 * np.sqrt(x**(-4.14) - 5*x**(-2) +
+            111*(1 - x**2 + 0.5*x**4)/(1 + 0.5*x**2))
+
+def make_asd_file(filename, f_max=4096.0, delta_f=0.25):
+    """
+    Write a two-column (frequency, ASD) file as read by nrbu.get_psd
+    """
+    frequencies = np.arange(delta_f, f_max, delta_f)
+    np.savetxt(filename, np.array([frequencies, aligo_asd(frequencies)]).T)
+    return filename
+
+def make_reconstructions(filename, nsamples=10, sample_rate=1024,
+        datalen=4.0, seed=0):
+    """
+    Write nsamples whitened burst reconstructions (one per row) to filename:
+    chirps with randomised frequency scale and arrival time plus white noise
+    """
+
+    rng = np.random.RandomState(seed)
+
+    times = np.arange(int(datalen*sample_rate)) / float(sample_rate)
+    reconstructions = np.zeros(shape=(nsamples, len(times)))
+
+    for s in xrange(nsamples):
+        tc = 0.5*datalen + rng.uniform(-0.05, 0.05)
+        scale = rng.uniform(0.8, 1.2)
+        tau = (times - tc) * 1000.0 * scale / 70.0
+        reconstructions[s,:] = np.exp(-0.5*tau**2) * \
+                np.sin(2*np.pi*(4.0*tau + 1.5*tau**2)) + \
+                0.05*rng.randn(len(times))
+
+    np.savetxt(filename, reconstructions)
+
+    return filename
+
+def make_all(outdir, nsamples=10, sample_rate=1024, datalen=4.0):
+    """
+    Generate every fixture in outdir and return a dictionary of their paths
+    """
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    paths = dict()
+    paths['catalog'] = os.path.join(outdir, 'catalog')
+    paths['wavefiles'] = make_catalog(paths['catalog'])
+    paths['asd'] = make_asd_file(os.path.join(outdir, 'asd.dat'))
+    paths['h1_reconstruction'] = make_reconstructions(
+            os.path.join(outdir, 'H1_reconstructions.dat'), nsamples=nsamples,
+            sample_rate=sample_rate, datalen=datalen, seed=1)
+    paths['l1_reconstruction'] = make_reconstructions(
+            os.path.join(outdir, 'L1_reconstructions.dat'), nsamples=nsamples,
+            sample_rate=sample_rate, datalen=datalen, seed=2)
+
+    return paths
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print >> sys.stderr, "ERROR: usage: fixtures.py <output directory>"
+        sys.exit(-1)
+    paths = make_all(sys.argv[1])
+    for key in sorted(paths.keys()):
+        print >> sys.stdout, key, paths[key]
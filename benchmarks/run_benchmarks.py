@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+run_benchmarks.py
+
+Timed cases for the fitting-factor hot path, run on locally generated
+fixtures (see fixtures.py):
+
+    catalog_load            nrbu.simulation_details on the fixture catalog
+    get_wf_pols             NR_hdf5_pycbc generation over a grid of masses
+    single_ifo_match        single_ifo_match with snr_calc
+    single_ifo_match_kernel single_ifo_match with a match_kernel
+    network_match           network_match with snr_calc
+    network_match_kernel    network_match with a match_kernel
+    fmin_optimisation       full mass / inclination optimisation of one
+                            reconstruction sample, as in nrburst_netmatch.py
+
+Results (wall-clock statistics per case, plus the environment) are written to
+JSON; with --compare the ratio to a previous results file is printed.
+
+Usage:
+
+    run_benchmarks.py [--output-file bench.json] [--compare old.json]
+"""
+
+import sys, os
+import platform
+import subprocess
+import tempfile
+import json
+import timeit
+from optparse import OptionParser
+
+import numpy as np
+import scipy.optimize
+
+import nrburst_utils as nrbu
+import nrburst_kernel as nrbu_kernel
+import nrburst_wfcache as nrbu_wfcache
+
+import fixtures
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+sample_rate = 1024
+datalen = 4.0
+delta_t = 1./sample_rate
+
+def timed(func, nrepeat=5):
+    """
+    Call func() nrepeat times and return wall-clock statistics (s)
+    """
+
+    times = np.zeros(nrepeat)
+    for n in xrange(nrepeat):
+        then = timeit.default_timer()
+        func()
+        times[n] = timeit.default_timer() - then
+
+    return {'nrepeat':nrepeat, 'mean':times.mean(), 'std':times.std(),
+            'min':times.min(), 'max':times.max()}
+
+def environment():
+    """
+    Description of the environment the benchmarks ran in
+    """
+
+    env = {'python':platform.python_version(), 'platform':platform.platform(),
+            'numpy':np.__version__, 'pyfftw':nrbu_kernel._have_fftw,
+            'time':timeit.time.time()}
+
+    try:
+        env['git_version'] = subprocess.check_output(['git', 'rev-parse',
+            'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        env['git_version'] = None
+
+    return env
+
+def run_cases(paths, nrepeat=5):
+    """
+    Run every case on the fixtures in paths (see fixtures.make_all) and
+    return a dictionary of results
+    """
+
+    # Always time the generation itself
+    nrbu_wfcache.configure(None)
+
+    results = dict()
+
+    # --- Catalog
+    results['catalog_load'] = timed(lambda:
+            nrbu.simulation_details(catdir=paths['catalog']), nrepeat)
+
+    simulations = nrbu.simulation_details(catdir=paths['catalog'])
+    sim = simulations.simulations[0]
+    wavefile = sim['wavefile']
+
+    min_mass = sim['Mmin30Hz']
+    max_mass = 3*min_mass
+    masses = np.linspace(min_mass, max_mass, 5)
+
+    # --- Generation
+    results['get_wf_pols'] = timed(lambda: [nrbu.get_wf_pols(wavefile, mass,
+        inclination=45.0, delta_t=delta_t) for mass in masses], nrepeat)
+
+    # --- Matches
+    h1_rec_data = np.loadtxt(paths['h1_reconstruction'])
+    l1_rec_data = np.loadtxt(paths['l1_reconstruction'])
+
+    flen = int(datalen*sample_rate/2) + 1
+    h1_asd = np.sqrt(nrbu.get_psd(paths['asd'], 1./datalen, flen,
+        interpolation='log').numpy())
+    l1_asd = h1_asd
+
+    params = (1.5*min_mass, 45.0)
+    mass_bounds = (min_mass, max_mass)
+
+    kernel = nrbu_kernel.match_kernel(delta_t, f_min=30.0)
+
+    results['single_ifo_match'] = timed(lambda: nrbu.single_ifo_match(params,
+        nrfile=wavefile, mass_bounds=mass_bounds, rec_data=h1_rec_data[0],
+        asd=h1_asd, delta_t=delta_t), nrepeat)
+
+    results['single_ifo_match_kernel'] = timed(lambda:
+            nrbu.single_ifo_match(params, nrfile=wavefile,
+                mass_bounds=mass_bounds, rec_data=h1_rec_data[0], asd=h1_asd,
+                delta_t=delta_t, kernel=kernel), nrepeat)
+
+    network_args = dict(nrfile=wavefile, mass_bounds=mass_bounds,
+            h1_rec_data=h1_rec_data[0], h1_asd=h1_asd,
+            l1_rec_data=l1_rec_data[0], l1_asd=l1_asd, delta_t=delta_t)
+
+    results['network_match'] = timed(lambda: nrbu.network_match(params,
+        **network_args), nrepeat)
+
+    results['network_match_kernel'] = timed(lambda: nrbu.network_match(params,
+        kernel=kernel, **network_args), nrepeat)
+
+    # --- Full optimisation of one sample
+    fevals = []
+    def optimise():
+        result = scipy.optimize.fmin(nrbu.network_mismatch,
+                x0=np.array(params), args=(wavefile, mass_bounds,
+                    h1_rec_data[0], h1_asd, l1_rec_data[0], l1_asd, delta_t,
+                    30.0, kernel), xtol=1e-3, ftol=1e-3, maxfun=10000,
+                full_output=True, disp=False)
+        fevals.append(result[3])
+
+    results['fmin_optimisation'] = timed(optimise, max(1, nrepeat/5))
+    results['fmin_optimisation']['fevals'] = int(np.mean(fevals))
+
+    return results
+
+def compare(results, baseline_file):
+    """
+    Print the ratio of the mean time of each case to that in baseline_file
+    """
+
+    baseline = json.load(open(baseline_file, 'r'))['cases']
+
+    print >> sys.stdout, "%-25s %12s %12s %8s"%("case", "baseline", "now",
+            "ratio")
+    for case in sorted(results.keys()):
+        if case not in baseline:
+            continue
+        print >> sys.stdout, "%-25s %12.4e %12.4e %8.2f"%(case,
+                baseline[case]['mean'], results[case]['mean'],
+                results[case]['mean'] / baseline[case]['mean'])
+
+def parser():
+
+    parser = OptionParser()
+    parser.add_option("-o", "--output-file", type=str, default="bench.json")
+    parser.add_option("-d", "--fixtures-dir", type=str, default=None)
+    parser.add_option("-n", "--nrepeat", type=int, default=5)
+    parser.add_option("-c", "--compare", type=str, default=None)
+
+    (opts,args) = parser.parse_args()
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    fixtures_dir = opts.fixtures_dir
+    if fixtures_dir is None:
+        fixtures_dir = tempfile.mkdtemp(prefix='nrburst_bench_')
+
+    print >> sys.stdout, "Generating fixtures in %s"%fixtures_dir
+    paths = fixtures.make_all(fixtures_dir, sample_rate=sample_rate,
+            datalen=datalen)
+
+    results = run_cases(paths, nrepeat=opts.nrepeat)
+
+    f = open(opts.output_file, 'w')
+    json.dump({'environment':environment(), 'cases':results}, f, indent=2,
+            sort_keys=True)
+    f.close()
+
+    print >> sys.stdout, "%-25s %12s %12s"%("case", "mean (s)", "min (s)")
+    for case in sorted(results.keys()):
+        print >> sys.stdout, "%-25s %12.4e %12.4e"%(case,
+                results[case]['mean'], results[case]['min'])
+
+    if opts.compare is not None:
+        compare(results, opts.compare)
+
+    print >> sys.stdout, "Results written to %s"%opts.output_file
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
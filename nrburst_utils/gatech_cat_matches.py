@@ -42,6 +42,7 @@ from pycbc import fft
 
 
 import nrburst_utils as nrbu
+import nrburst_nrasc as nrbu_asc
 
 from matplotlib import pyplot as pl
 
@@ -49,73 +50,6 @@ __author__ = "James Clark <james.clark@ligo.org>"
 gpsnow = subprocess.check_output(['lalapps_tconvert', 'now']).strip()
 __date__ = subprocess.check_output(['lalapps_tconvert', gpsnow]).strip()
 
-def window_wave(input_data):
-
-    nonzero=np.argwhere(abs(input_data)>1e-3*max(abs(input_data)))
-    idx = range(nonzero[0],nonzero[-1])
-    win = planckwin(len(idx), 0.3)
-    win[int(0.5*len(win)):] = 1.0
-    input_data[idx] *= win
-
-    return input_data
-
-def planckwin(N, epsilon):
-
-    t1 = -0.5*N
-    t2 = -0.5*N * (1.-2.*epsilon)
-    t3 = 0.5*N * (1.-2.*epsilon)
-    t4 = 0.5*N
-
-    Zp = lambda t: (t2-t1)/(t-t1) + (t2-t1)/(t-t2)
-    Zm = lambda t: (t3-t4)/(t-t3) + (t3-t4)/(t-t4)
-
-    win = np.zeros(N)
-    ts = np.arange(-0.5*N, 0.5*N)
-
-    for n,t in enumerate(ts):
-        if t<=t1:
-            win[n] = 0.0
-        elif t1<t<t2:
-            win[n] = 1./(np.exp(Zp(t))+1)
-        elif t2<=t<=t3:
-            win[n] = 1.0
-        elif t3<t<t4:
-            win[n] = 1./(np.exp(Zm(t))+1)
-
-    return win
-
-
-def scale_NR(times_codeunits, wave, mass, delta_t=1./2048):
-    """
-    Scale the waveform to total_mass.  Assumes the waveform is initially
-    generated at init_total_mass defined in this script.
-    """
-
-    peakidx = np.argmax(abs(wave))
-
-    NR_deltaT = np.diff(times_codeunits)[0]
-    NR_datalen = len(times_codeunits)
-    SI_deltaT_of_NR = mass * lal.MTSUN_SI * NR_deltaT
-
-#    old_times = np.arange(0, NR_datalen*SI_deltaT_of_NR, SI_deltaT_of_NR)
-    old_times = np.linspace(0, NR_datalen*SI_deltaT_of_NR, len(wave))
-    interp_times = np.arange(0, NR_datalen*SI_deltaT_of_NR, delta_t)
-
-    resampled_wave = np.interp(interp_times, old_times, wave)
-
-    return pycbc.types.TimeSeries(resampled_wave, delta_t)
-
-def parse_NR_asc(file):
-    data = np.loadtxt(file)
-    times_codeunits     = np.loadtxt(file)[:,0]
-    hplus_NR_codeunits  = data[:,1]
-    hcross_NR_codeunits = data[:,2]
-    dAmpbyAmp_codeunits = data[:,3]
-    dphi_codeunits      = data[:,4]
-
-    return (times_codeunits, hplus_NR_codeunits, hcross_NR_codeunits,
-            dAmpbyAmp_codeunits, dphi_codeunits)
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Parse input
 
@@ -232,8 +166,6 @@ simulations = \
 if simulations.simulations[0]['wavefile'].split('/')[-1] ==  'GATECH1469.h5':
     simulations.simulations[0]['Mmin30Hz'] = 71.0
 
-asd_data = np.loadtxt(asd_file)
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Match Calculations
 #
@@ -249,15 +181,16 @@ asd_data = np.loadtxt(asd_file)
 #   each dictionary is 1 GAtech waveform with all physical attributes, as well
 #   as matches at 5 mass scales with some selection of approximants
 
-# Extract the data
-if errors_file is not None:
-    times_codeunits, hplus_NR_codeunits, hcross_NR_codeunits, \
-            dAmpbyAmp_codeunits, dphi_codeunits = parse_NR_asc(errors_file)
-
 # Set up the Masses we're going to study
 masses = np.linspace(simulations.simulations[0]['Mmin30Hz'], maxMass,
         nMassPoints) #+ 5
 
+# Extract the data and scale all channels to all masses at once
+if errors_file is not None:
+    times_codeunits, NR_codeunits = nrbu_asc.load_NR_asc(errors_file)
+    NR_resampled, NR_lengths = nrbu_asc.resample_NR(times_codeunits,
+            NR_codeunits, masses, delta_t=delta_t)
+
 # matches is going to be a list of tuples: (mass, match)
 matches = []
 
@@ -292,16 +225,15 @@ for m,mass in enumerate(masses):
     else:
         # --- read the polarisations and errors from ascii
 
-        hplus_NR  = scale_NR(times_codeunits, hplus_NR_codeunits, mass,
-                delta_t=delta_t)
-        hcross_NR = scale_NR(times_codeunits, hcross_NR_codeunits, mass,
-                delta_t=delta_t)
+        hplus_NR  = pycbc.types.TimeSeries(NR_resampled[0,m,:NR_lengths[m]],
+                delta_t)
+        hcross_NR = pycbc.types.TimeSeries(NR_resampled[1,m,:NR_lengths[m]],
+                delta_t)
 
-        #hplus_NR.data = window_wave(hplus_NR.data)
-        #hcross_NR.data = window_wave(hcross_NR.data)
-
-        dAmpbyAmp = scale_NR(times_codeunits, dAmpbyAmp_codeunits, mass, delta_t=delta_t)
-        dphi      = scale_NR(times_codeunits, dphi_codeunits, mass, delta_t=delta_t)
+        dAmpbyAmp = pycbc.types.TimeSeries(NR_resampled[2,m,:NR_lengths[m]],
+                delta_t)
+        dphi      = pycbc.types.TimeSeries(NR_resampled[3,m,:NR_lengths[m]],
+                delta_t)
 
     NR_freqs = wfutils.frequency_from_polarizations(hplus_NR, hcross_NR)
 
@@ -395,14 +327,10 @@ for m,mass in enumerate(masses):
     delta_f = 1./(tlen*delta_t)
     sample_frequencies = np.arange(0, 0.5 / delta_t, delta_f)
 
-    # Interpolate the ASD to the waveform frequencies (this is convenient so that we
-    # end up with a PSD which overs all frequencies for use in the match calculation
-    # later
-    asd = np.interp(sample_frequencies, asd_data[:,0], asd_data[:,1])
-
-    # Now insert ASD into a pycbc frequency series so we can use
-    # pycbc.filter.match() later
-    noise_psd = pycbc.types.FrequencySeries(asd**2, delta_f = delta_f)
+    # PSD covering all the waveform frequencies for use in pycbc.filter.match()
+    # (computed once per frequency grid and cached)
+    noise_psd = nrbu.get_psd(asd_file, delta_f, len(sample_frequencies))
+    asd = np.sqrt(noise_psd.numpy())
 
     if approx in td_approximants():
 
@@ -535,6 +463,10 @@ for m,mass in enumerate(masses):
 
 f.tight_layout()
 f.savefig(savename.replace('.','p')+'png')
+
+psd_info = nrbu.psd_cache_info()
+print >> sys.stdout, "PSD cache: %d hits, %d misses"%(psd_info['hits'],
+        psd_info['misses'])
         # ------------------------------------------------------------------
 
 
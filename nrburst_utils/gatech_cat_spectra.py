@@ -48,72 +48,6 @@ __author__ = "James Clark <james.clark@ligo.org>"
 gpsnow = subprocess.check_output(['lalapps_tconvert', 'now']).strip()
 __date__ = subprocess.check_output(['lalapps_tconvert', gpsnow]).strip()
 
-def window_wave(input_data):
-
-    nonzero=np.argwhere(abs(input_data)>1e-3*max(abs(input_data)))
-    idx = range(nonzero[0],nonzero[-1])
-    win = planckwin(len(idx), 0.3)
-    win[0.5*len(win):] = 1.0
-    input_data[idx] *= win
-
-    return input_data
-
-def planckwin(N, epsilon):
-
-    t1 = -0.5*N
-    t2 = -0.5*N * (1.-2.*epsilon)
-    t3 = 0.5*N * (1.-2.*epsilon)
-    t4 = 0.5*N
-
-    Zp = lambda t: (t2-t1)/(t-t1) + (t2-t1)/(t-t2)
-    Zm = lambda t: (t3-t4)/(t-t3) + (t3-t4)/(t-t4)
-
-    win = np.zeros(N)
-    ts = np.arange(-0.5*N, 0.5*N)
-
-    for n,t in enumerate(ts):
-        if t<=t1:
-            win[n] = 0.0
-        elif t1<t<t2:
-            win[n] = 1./(np.exp(Zp(t))+1)
-        elif t2<=t<=t3:
-            win[n] = 1.0
-        elif t3<t<t4:
-            win[n] = 1./(np.exp(Zm(t))+1)
-
-    return win
-
-
-def scale_NR(times_codeunits, wave, mass, delta_t=1./2048):
-    """
-    Scale the waveform to total_mass.  Assumes the waveform is initially
-    generated at init_total_mass defined in this script.
-    """
-
-    peakidx = np.argmax(abs(wave))
-
-    NR_deltaT = np.diff(times_codeunits)[0]
-    NR_datalen = len(times_codeunits)
-    SI_deltaT_of_NR = mass * lal.MTSUN_SI * NR_deltaT
-
-    old_times = np.arange(0, NR_datalen*SI_deltaT_of_NR, SI_deltaT_of_NR)
-    interp_times = np.arange(0, NR_datalen*SI_deltaT_of_NR, delta_t)
-
-    resampled_wave = np.interp(interp_times, old_times, wave)
-
-    return pycbc.types.TimeSeries(resampled_wave, delta_t)
-
-def parse_NR_asc(file):
-    data = np.loadtxt(file)
-    times_codeunits     = np.loadtxt(file)[:,0]
-    hplus_NR_codeunits  = data[:,1]
-    hcross_NR_codeunits = data[:,2]
-    dAmpbyAmp_codeunits = data[:,3]
-    dphi_codeunits      = data[:,4]
-
-    return (times_codeunits, hplus_NR_codeunits, hcross_NR_codeunits,
-            dAmpbyAmp_codeunits, dphi_codeunits)
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Parse input
 
@@ -173,7 +107,6 @@ simulations = \
         nrbu.simulation_details(param_bounds=bounds, catdir=catalog)
 filename = simulations.simulations[sim_number]['wavefile'].split('/')[-1]
 
-asd_data = np.loadtxt(asd_file)
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Match Calculation & plotting
@@ -241,17 +174,10 @@ hcross_approx.resize(tlen)
 hcross_NR.resize(tlen)
 
 
-# Interpolate the ASD to the waveform frequencies (this is convenient so that we
-# end up with a PSD which overs all frequencies for use in the match calculation
-# later
-asd = np.interp(hplus_approx.to_frequencyseries().sample_frequencies,
-        asd_data[:,0], asd_data[:,1])
-
-
-# Now insert ASD into a pycbc frequency series so we can use
-# pycbc.filter.match() later
-noise_psd = pycbc.types.FrequencySeries(asd**2, delta_f =
-        hplus_approx.to_frequencyseries().delta_f)
+# PSD covering all the waveform frequencies for use in pycbc.filter.match()
+Hplus_approx = hplus_approx.to_frequencyseries()
+noise_psd = nrbu.get_psd(asd_file, Hplus_approx.delta_f, len(Hplus_approx))
+asd = np.sqrt(noise_psd.numpy())
 
 
 match, _ = pycbc.filter.match(hplus_approx, hplus_NR,
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+gatech_cat_survey.py
+
+Catalog-wide NR accuracy survey: for every selected simulation and mass point,
+compute the NR vs approximant mismatch and (where an ascii error file is
+available) the mismatch between the NR waveform and its upper / lower
+amplitude+phase error bands.  Simulations are farmed out to a pool of worker
+processes and all results are written to one table.
+
+Per-simulation results are cached in --cache-dir, keyed on the waveform (and
+error) file paths, sizes and modification times and the survey settings, so
+re-running the survey only recomputes new or changed simulations.
+
+The error map is an ascii file with one line per simulation:
+
+    <wavefile basename>  <path to NR ascii strain+error file>
+
+Usage:
+
+    gatech_cat_survey.py --catalog <gatech_hdf5> --asd-file <asd> \\
+        [--bound q,1,2 --bound a1,0,0.6] [--errors-map errors.txt] \\
+        [--nprocesses 8] [--output survey.txt]
+"""
+
+import sys, os
+import hashlib
+import tempfile
+import cPickle as pickle
+from optparse import OptionParser
+import multiprocessing
+
+import numpy as np
+
+import nrburst_utils as nrbu
+import nrburst_profile as nrbu_profile
+import nrburst_masssweep as nrbu_sweep
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Parameters of each simulation reported in the results table
+__survey_params__ = ['q', 'a1', 'a2', 'spin1z', 'spin2z', 'Mmin30Hz']
+
+# Parameters of each simulation which determine its survey results (the
+# reported parameters, the mass grid and the approximant / frequency
+# parameters)
+__cache_params__ = sorted(set(__survey_params__ + ['eta', 'spin1x', 'spin1y',
+    'spin1z', 'spin2x', 'spin2y', 'spin2z']))
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Caching
+
+def _file_signature(filename):
+    """
+    (absolute path, size, mtime) of filename, or None if there is no file
+    """
+    if filename is None:
+        return None
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+def cache_key(sim, errors_file, settings):
+    """
+    Hash identifying the survey results for a simulation: changes if either
+    of its data files, its (README) parameters in __cache_params__, the ASD
+    file or any of the survey settings change
+    """
+    key = hashlib.sha1()
+    key.update(repr(_file_signature(sim['wavefile'])))
+    key.update(repr([(param, sim.get(param)) for param in __cache_params__]))
+    key.update(repr(_file_signature(errors_file)))
+    key.update(repr(_file_signature(settings['asd_file'])))
+    key.update(repr(sorted(settings.items())))
+    return key.hexdigest()
+
+def _cache_file(cache_dir, sim, key):
+    return os.path.join(cache_dir, "%s-%s.pickle"%(
+        os.path.basename(sim['wavefile']).replace('.h5',''), key))
+
+def _load_cached(cache_file):
+    """
+    Results in cache_file, or None if there are none (or the file is
+    unreadable, e.g. truncated by a killed worker)
+    """
+
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        f = open(cache_file, 'rb')
+        try:
+            return pickle.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+            IndexError, AttributeError):
+        print >> sys.stderr, "Ignoring unreadable cache file %s"%cache_file
+        return None
+
+def _store_cached(cache_file, results):
+    """
+    Write results to cache_file via a temporary file, so that an interrupted
+    write never leaves a partial cache file
+    """
+
+    fd, tmpfile = tempfile.mkstemp(suffix='.tmp',
+            dir=os.path.dirname(cache_file))
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump(results, f, protocol=2)
+        finally:
+            f.close()
+        os.rename(tmpfile, cache_file)
+    except:
+        if os.path.exists(tmpfile): os.remove(tmpfile)
+        raise
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Survey
+
+def _survey_simulation(args):
+    """
+    Worker: compute the survey results for a single simulation, or load them
+    from the cache if they already exist
+    """
+
+    sim, errors_file, settings, cache_dir = args
+
+    if cache_dir is not None:
+        cache_file = _cache_file(cache_dir, sim, cache_key(sim, errors_file,
+            settings))
+        results = _load_cached(cache_file)
+        if results is not None:
+            return results
+
+    engine = nrbu_sweep.mismatch_engine(settings['asd_file'],
+            approx=settings['approx'], delta_t=settings['delta_t'],
+            datalen=settings['datalen'], f_min=settings['f_min'])
+
+    masses = engine.mass_grid(sim, nmasses=settings['nmasses'],
+            max_mass=settings['max_mass'])
+
+    results = dict()
+    results['wavefile'] = os.path.basename(sim['wavefile'])
+    results['masses'] = masses
+    for param in __survey_params__:
+        results[param] = sim[param]
+
+    results['mismatch'] = engine.mismatches(sim, masses)
+
+    if errors_file is not None:
+        results['mismatch_upp'], results['mismatch_low'] = \
+                engine.error_band_mismatches(sim, errors_file, masses)
+    else:
+        results['mismatch_upp'] = np.nan*np.ones(len(masses))
+        results['mismatch_low'] = np.nan*np.ones(len(masses))
+
+    if cache_dir is not None:
+        _store_cached(cache_file, results)
+
+    return results
+
+def run_survey(simulations, settings, errors_map=None, cache_dir=None,
+        nprocesses=1):
+    """
+    Survey results (see _survey_simulation) for each simulation in
+    simulations, computed across nprocesses worker processes
+    """
+
+    if errors_map is None:
+        errors_map = dict()
+
+    if cache_dir is not None and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    args = [(sim, errors_map.get(os.path.basename(sim['wavefile'])), settings,
+        cache_dir) for sim in simulations]
+
+    if nprocesses > 1:
+        pool = multiprocessing.Pool(nprocesses)
+        results = pool.map(_survey_simulation, args, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = map(_survey_simulation, args)
+
+    return results
+
+def read_errors_map(filename):
+    """
+    Dictionary of wavefile basename -> NR ascii error file from the two-column
+    file filename
+    """
+    errors_map = dict()
+    for line in open(filename, 'r'):
+        if line.startswith('#') or not line.strip():
+            continue
+        wavefile, errors_file = line.split()[:2]
+        errors_map[wavefile] = errors_file
+    return errors_map
+
+def write_results(results, filename):
+    """
+    Write one row per (simulation, mass) to the ascii table filename
+    """
+
+    f = open(filename, 'w')
+    f.write("# wavefile %s mass mismatch mismatch_upp mismatch_low\n"%(
+        " ".join(__survey_params__)))
+
+    for result in results:
+        params = " ".join(["%.4f"%result[param] for param in __survey_params__])
+        for m, mass in enumerate(result['masses']):
+            f.write("%s %s %.2f %.6e %.6e %.6e\n"%(result['wavefile'], params,
+                mass, result['mismatch'][m], result['mismatch_upp'][m],
+                result['mismatch_low'][m]))
+
+    f.close()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Command line
+
+def parser():
+
+    # --- Command line input
+    parser = OptionParser()
+    parser.add_option("-c", "--catalog", type=str, default=None)
+    parser.add_option("-n", "--asd-file", type=str, default=None)
+    parser.add_option("-a", "--approximant", type=str, default="SEOBNRv2")
+    parser.add_option("-b", "--bound", type=str, action="append", default=None,
+            help="parameter bound: name,low,high (may be repeated)")
+    parser.add_option("-s", "--simulation", type=str, action="append",
+            default=None)
+    parser.add_option("-e", "--errors-map", type=str, default=None)
+    parser.add_option("--n-mass-points", type=int, default=5)
+    parser.add_option("--max-mass", type=float, default=500.0)
+    parser.add_option("--sample-rate", type=int, default=4096)
+    parser.add_option("--datalen", type=float, default=16.0)
+    parser.add_option("--f-min", type=float, default=30.0)
+    parser.add_option("-p", "--nprocesses", type=int, default=1)
+    parser.add_option("--cache-dir", type=str, default="survey_cache")
+    parser.add_option("--no-cache", action="store_true", default=False)
+    parser.add_option("-o", "--output", type=str, default="survey.txt")
+    nrbu_profile.add_profile_option(parser)
+
+    (opts,args) = parser.parse_args()
+
+    nrbu_profile.start_from_options(opts)
+
+    if opts.catalog is None or opts.asd_file is None:
+        print >> sys.stderr, "ERROR: require --catalog and --asd-file"
+        sys.exit(-1)
+
+    param_bounds = None
+    if opts.bound is not None:
+        param_bounds = dict()
+        for bound in opts.bound:
+            try:
+                name, low, high = bound.split(',')
+                param_bounds[name] = [float(low), float(high)]
+            except ValueError:
+                print >> sys.stderr, "ERROR: bound %s not of form name,low,high"%(
+                        bound)
+                sys.exit(-1)
+    opts.param_bounds = param_bounds
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    simulations = nrbu.simulation_details(param_bounds=opts.param_bounds,
+            catdir=opts.catalog)
+
+    sims = simulations.simulations
+    if opts.simulation is not None:
+        sims = [sim for sim in sims if os.path.basename(sim['wavefile']) in
+                opts.simulation]
+
+    errors_map = None
+    if opts.errors_map is not None:
+        errors_map = read_errors_map(opts.errors_map)
+
+    settings = {'asd_file':os.path.abspath(opts.asd_file),
+            'approx':opts.approximant, 'delta_t':1./opts.sample_rate,
+            'datalen':opts.datalen, 'f_min':opts.f_min,
+            'nmasses':opts.n_mass_points, 'max_mass':opts.max_mass}
+
+    cache_dir = None
+    if not opts.no_cache:
+        cache_dir = opts.cache_dir
+
+    print >> sys.stdout, "Surveying %d simulations"%len(sims)
+
+    results = run_survey(sims, settings, errors_map=errors_map,
+            cache_dir=cache_dir, nprocesses=opts.nprocesses)
+
+    write_results(results, opts.output)
+
+    print >> sys.stdout, "Results written to %s"%opts.output
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
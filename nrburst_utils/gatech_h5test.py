@@ -128,16 +128,15 @@ hp_tapered.resize(tlen+1)
 hc_tapered.resize(tlen+1)
 signal.resize(tlen+1)
 
-freq_axis = signal.to_frequencyseries().sample_frequencies.data[:]
+Signal = signal.to_frequencyseries()
 
-asd_data = \
-        np.loadtxt('/home/jclark/Projects/GW150914_data/bw_reconstructions/GW150914/IFO0_asd.dat')
+asd_file = \
+        '/home/jclark/Projects/GW150914_data/bw_reconstructions/GW150914/IFO0_asd.dat'
 
-asd = np.interp(freq_axis, asd_data[:,0], asd_data[:,1])
-psd=pycbc.types.FrequencySeries(asd**2, delta_f=np.diff(freq_axis)[0])
+psd = nrbu.get_psd(asd_file, Signal.delta_f, len(Signal))
 
 match, _ = pycbc.filter.match(signal, hp_tapered, low_frequency_cutoff=30,
-        psd=pycbc.types.FrequencySeries(asd**2, delta_f=np.diff(freq_axis)[0]))
+        psd=psd)
 
 print 'match=%f'%match
 
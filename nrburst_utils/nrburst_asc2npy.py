@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_asc2npy.py
+
+One-time conversion of (BayesWave) reconstruction ASCII matrices, one sample
+per row, to .npy files which the match scripts memory-map instead of parsing:
+
+    nrburst_asc2npy.py signal_recovered_whitened_waveform.dat.0 ...
+
+writes signal_recovered_whitened_waveform.dat.0.npy etc.  The ASCII file is
+read in blocks of rows and written straight into the memory-mapped output,
+so the conversion never holds the whole matrix in memory.
+
+load() is used by the match scripts to read a reconstruction: a .npy file
+(given directly, or alongside an ASCII file and newer than it) is
+memory-mapped read-only, so that only the samples actually used are read
+from disk; otherwise the ASCII file is read with np.loadtxt as before.
+"""
+
+import sys, os
+import itertools
+import tempfile
+from optparse import OptionParser
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Rows of ASCII parsed at a time
+__block_rows__ = 256
+
+def npy_filename(ascii_file):
+    """
+    The .npy file corresponding to ascii_file
+    """
+    return ascii_file + '.npy'
+
+def _count_rows(ascii_file):
+    """
+    Number of (non-empty) rows and columns in ascii_file
+    """
+
+    nrows = 0
+    ncols = None
+    f = open(ascii_file, 'r')
+    for line in f:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        if ncols is None:
+            ncols = len(line.split())
+        nrows += 1
+    f.close()
+
+    return nrows, ncols
+
+def convert(ascii_file, npy_file=None, block_rows=__block_rows__):
+    """
+    Convert the ASCII matrix in ascii_file to the .npy file npy_file (default
+    npy_filename(ascii_file)), block_rows rows at a time.  Returns npy_file.
+
+    The matrix is written to a temporary file which is renamed to npy_file
+    once complete, so an interrupted conversion never leaves a partial
+    npy_file for load() to map.
+    """
+
+    if npy_file is None:
+        npy_file = npy_filename(ascii_file)
+
+    nrows, ncols = _count_rows(ascii_file)
+
+    if nrows == 1:
+        shape = (ncols,)
+    elif ncols == 1:
+        shape = (nrows,)
+    else:
+        shape = (nrows, ncols)
+
+    fd, tmpfile = tempfile.mkstemp(suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(npy_file)))
+    os.close(fd)
+
+    try:
+        _write_blocks(ascii_file, tmpfile, shape, nrows, ncols, block_rows)
+        # mkstemp files are private; use the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpfile, 0666 & ~umask)
+        os.rename(tmpfile, npy_file)
+    except:
+        os.remove(tmpfile)
+        raise
+
+    return npy_file
+
+def _write_blocks(ascii_file, npy_file, shape, nrows, ncols, block_rows):
+    """
+    Stream the rows of ascii_file into a new .npy file npy_file of the given
+    shape
+    """
+
+    output = open_memmap(npy_file, mode='w+', dtype=np.float64, shape=shape)
+
+    f = open(ascii_file, 'r')
+    lines = (line for line in f if line.strip() and not
+            line.lstrip().startswith('#'))
+
+    row = 0
+    while row < nrows:
+        block = list(itertools.islice(lines, block_rows))
+        data = np.loadtxt(block, ndmin=2)
+        if ncols == 1:
+            data = data[:,0]
+        if nrows == 1:
+            output[:] = data[0]
+        else:
+            output[row:row+len(block)] = data
+        row += len(block)
+
+    f.close()
+
+    output.flush()
+    del output
+
+def load(filename, mmap=True):
+    """
+    Read the reconstruction in filename: a .npy file (filename itself, or
+    npy_filename(filename) if it is at least as new) is memory-mapped
+    read-only if mmap is True; an ASCII file is parsed with np.loadtxt
+    """
+
+    if filename.endswith('.npy'):
+        npy_file = filename
+    else:
+        npy_file = npy_filename(filename)
+        if not os.path.exists(npy_file) or \
+                os.path.getmtime(npy_file) < os.path.getmtime(filename):
+            return np.loadtxt(filename)
+
+    if mmap:
+        return np.load(npy_file, mmap_mode='r')
+    else:
+        return np.load(npy_file)
+
+def parser():
+
+    # --- Command line input
+    parser = OptionParser(usage="%prog [options] file1.dat file2.dat ...")
+    parser.add_option("-b", "--block-rows", type=int, default=__block_rows__)
+
+    (opts,args) = parser.parse_args()
+
+    if len(args)==0:
+        print >> sys.stderr, "ERROR: require at least one ASCII file"
+        sys.exit(-1)
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    for ascii_file in args:
+        npy_file = convert(ascii_file, block_rows=opts.block_rows)
+        print >> sys.stdout, "%s -> %s %s"%(ascii_file, npy_file,
+                np.load(npy_file, mmap_mode='r').shape)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_batchmatch.py
+
+Network fitting factors for many events (e.g., a BW / CWB analysis and a
+campaign of hardware injections) in a single process.  Each event is
+described by its own ini file, as for nrburst_netmatch.py.
+
+Compared with one nrburst_netmatch.py invocation per event:
+
+    - each catalog (and the NR metadata) is loaded once and shared by every
+      event with the same catalog and chirp-mass bounds
+    - generated templates are kept in an in-memory memo (see
+      nrburst_utils.configure_template_memo) shared by all events, and the
+      optimiser starting points for each simulation are seeded identically
+      for every event, so events with the same delta_t start from, and reuse,
+      the same templates
+    - one match kernel (FFT plans) is shared by events with the same delta_t
+      and peak interpolation
+    - a single pickle holds the results of all events
+
+Usage:
+
+    nrburst_batchmatch.py [options] event1.ini event2.ini ...
+"""
+
+import sys, os
+import ConfigParser
+from optparse import OptionParser
+import cPickle as pickle
+
+import nrburst_utils as nrbu
+import nrburst_fitfactor as nrbu_ff
+import nrburst_kernel as nrbu_kernel
+import nrburst_timing as nrbu_timing
+import nrburst_profile as nrbu_profile
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+__algorithms__ = ["BW", "CWB", "HWINJ"]
+
+def event_name(ini_file):
+    """
+    Label for the event described by ini_file (its basename without .ini)
+    """
+    return os.path.splitext(os.path.basename(ini_file))[0]
+
+def read_event(ini_file):
+    """
+    Return the configuration for the event in ini_file
+    """
+
+    if not os.path.exists(ini_file):
+        print >> sys.stderr, "ERROR: config file %s not found"%ini_file
+        sys.exit(-1)
+
+    configparser = ConfigParser.ConfigParser()
+    configparser.read(ini_file)
+
+    if not configparser.has_option('analysis', 'algorithm') or \
+            configparser.get('analysis', 'algorithm') not in __algorithms__:
+        print >> sys.stderr, "ERROR: algorithm not defined in %s"%ini_file
+        print >> sys.stderr, "must be in ", __algorithms__
+        sys.exit(-1)
+
+    return nrbu.configuration(configparser)
+
+def run_batch(event_files, seed=0, verbose=True):
+    """
+    Network fitting factors for each event in event_files.  Returns a
+    dictionary keyed by event name of dictionaries holding the matches,
+    masses, inclinations, configuration and simulations for that event.
+    """
+
+    catalogs = dict()
+    kernels = dict()
+    results = dict()
+
+    for e, ini_file in enumerate(event_files):
+
+        name = event_name(ini_file)
+
+        print >> sys.stdout, "================================"
+        print >> sys.stdout, "Event %s (%d/%d)"%(name, e+1, len(event_files))
+
+        config = read_event(ini_file)
+
+        reconstructions = nrbu_ff.load_reconstructions(config,
+                ifos=['H1', 'L1'])
+        asds = nrbu_ff.load_asds(config, ifos=['H1', 'L1'])
+
+        catalog_key = (os.path.abspath(config.catalog), config.min_chirp_mass)
+        if catalog_key not in catalogs:
+            catalogs[catalog_key] = nrbu_ff.load_simulations(config)
+        simulations = catalogs[catalog_key]
+
+        kernel_key = (config.delta_t, config.peak_interpolation)
+        if kernel_key not in kernels:
+            kernels[kernel_key] = nrbu_kernel.match_kernel(config.delta_t,
+                    f_min=30.0, peak_interpolation=config.peak_interpolation)
+
+        matches, masses, inclinations = nrbu_ff.run_fitting_factor(config,
+                reconstructions, simulations, asds,
+                kernel=kernels[kernel_key], verbose=verbose, seed=seed)
+
+        results[name] = {'ini_file':os.path.abspath(ini_file),
+                'matches':matches, 'masses':masses,
+                'inclinations':inclinations, 'config':config,
+                'simulations':simulations}
+
+        memo = nrbu.template_memo_info()
+        print >> sys.stdout, "Template memo: %d hits, %d misses, %d stored"%(
+                memo['hits'], memo['misses'], memo['size'])
+
+    return results
+
+def parser():
+
+    # --- Command line input
+    parser = OptionParser(usage="%prog [options] event1.ini event2.ini ...")
+    parser.add_option("-t", "--user-tag", default="TEST", type=str)
+    parser.add_option("-o", "--output-file", type=str, default=None)
+    parser.add_option("--seed", type=int, default=0,
+            help="seed for the optimiser starting points")
+    parser.add_option("--template-memo-size", type=int, default=10000,
+            help="number of templates kept in memory (0: none)")
+    parser.add_option("-q", "--quiet", action="store_true", default=False)
+    parser.add_option("--timing", default=False, action="store_true")
+    parser.add_option("--timing-file", type=str, default=None)
+    nrbu_profile.add_profile_option(parser)
+
+    (opts,args) = parser.parse_args()
+
+    nrbu_profile.start_from_options(opts)
+
+    if len(args)==0:
+        print >> sys.stderr, "ERROR: require at least one event config file"
+        sys.exit(-1)
+
+    if opts.timing or opts.timing_file is not None:
+        nrbu_timing.configure(True)
+
+    if opts.output_file is None:
+        opts.output_file = 'batch_'+opts.user_tag+'.pickle'
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    nrbu.configure_template_memo(opts.template_memo_size)
+
+    results = run_batch(args, seed=opts.seed, verbose=not opts.quiet)
+
+    # Dump results and configurations to one pickle
+    pickle.dump(results, open(opts.output_file, "wb"))
+
+    print >> sys.stdout, "Results for %d events written to %s"%(len(results),
+            opts.output_file)
+
+    # Per-stage timing summary (with --timing)
+    nrbu_ff.write_timing(opts, opts.output_file)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
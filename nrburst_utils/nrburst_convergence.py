@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_convergence.py
+
+Resolution convergence of the GATech NR waveforms: mismatches between the
+same run at different resolutions as a function of total mass.
+
+Simulations are grouped by run using the 'hashtag' attribute of each HDF5
+file, whose suffix _m<N> gives the resolution (mres), e.g.:
+
+    Waveforms/GW15-series/GW15_D12_q1.22_a0.33_-0.44_m140/
+
+Every pair of resolutions of a run is matched over a grid of total masses.
+The PSD is computed once for the engine's (delta_t, datalen) grid and the
+resolution pairs are distributed over a pool of worker processes.
+"""
+
+import sys, os
+import re
+import itertools
+import multiprocessing
+
+import h5py
+import numpy as np
+
+import nrburst_utils as nrbu
+import nrburst_masssweep as nrbu_sweep
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Column layout of the convergence table
+__convergence_dtype__ = [('run', 'S128'), ('wavefile_a', 'S64'),
+        ('wavefile_b', 'S64'), ('mres_a', int), ('mres_b', int),
+        ('mass', float), ('mismatch', float)]
+
+def resolution_details(wavefile):
+    """
+    Return (run name, mres) for the NR HDF5 file wavefile, from the 'hashtag'
+    attribute (or the file name if there is no hashtag)
+    """
+
+    f = h5py.File(wavefile, 'r')
+    try:
+        tag = str(f.attrs['hashtag'])
+    except KeyError:
+        tag = os.path.basename(wavefile).replace('.h5', '')
+    f.close()
+
+    tag = tag.rstrip('/').split('/')[-1]
+
+    match = re.search('_[mM](\d+)$', tag)
+    if match is None:
+        print >> sys.stderr, "ERROR: cannot identify resolution of %s (%s)"%(
+                wavefile, tag)
+        sys.exit(-1)
+
+    return tag[:match.start()], int(match.group(1))
+
+def group_by_run(simulations):
+    """
+    Dictionary of run name -> list of the simulations of that run, sorted by
+    increasing mres.  The 'run' and 'mres' keys of each simulation are set.
+    """
+
+    runs = dict()
+    for sim in simulations:
+        sim['run'], sim['mres'] = resolution_details(sim['wavefile'])
+        runs.setdefault(sim['run'], []).append(sim)
+
+    for run in runs.keys():
+        runs[run].sort(key=lambda sim: sim['mres'])
+
+    return runs
+
+def _pair_waveforms(args):
+    """
+    Worker: NR frequency series of both simulations in a resolution pair at
+    each mass in masses, and the final frequency at each mass
+    """
+
+    sim_a, sim_b, masses, settings = args
+
+    min_mass = min(masses)
+
+    tildes_a = np.array([nrbu_sweep.nr_frequency_series(sim_a['wavefile'],
+        mass, 30.0001 * min_mass / mass, settings) for mass in masses])
+    tildes_b = np.array([nrbu_sweep.nr_frequency_series(sim_b['wavefile'],
+        mass, 30.0001 * min_mass / mass, settings) for mass in masses])
+
+    ffinals = np.array([nrbu_sweep.final_frequency(sim_a, mass) for mass in
+        masses])
+
+    return tildes_a, tildes_b, ffinals
+
+class convergence_engine:
+    """
+    Pairwise resolution mismatches over a grid of total masses, with the PSD
+    precomputed once for the engine's (delta_t, datalen) grid
+    """
+
+    def __init__(self, asd_file, delta_t=1./8192, datalen=4.0, f_min=30.0,
+            distance=100, nprocesses=1):
+
+        self.delta_t = delta_t
+        self.datalen = datalen
+        self.f_min = f_min
+
+        self.tlen = int(datalen / delta_t)
+        self.delta_f = 1.0 / (self.tlen*delta_t)
+        self.sample_frequencies = np.arange(self.tlen/2 + 1) * self.delta_f
+
+        self.settings = {'delta_t':delta_t, 'tlen':self.tlen,
+                'inclination':0.0, 'distance':distance}
+
+        self.psd = nrbu.get_psd(asd_file, self.delta_f,
+                len(self.sample_frequencies)).numpy()
+
+        self.nprocesses = nprocesses
+
+    def resolution_pairs(self, simulations):
+        """
+        List of (sim_a, sim_b) for every pair of resolutions of each run, with
+        sim_a the lower resolution
+        """
+
+        runs = group_by_run(simulations)
+
+        pairs = []
+        for run in sorted(runs.keys()):
+            pairs.extend(itertools.combinations(runs[run], 2))
+
+        return pairs
+
+    def convergence(self, simulations, nmasses=5, max_mass=500.0):
+        """
+        Mismatch vs total mass for every resolution pair in simulations.
+        Returns a structured array with one row per (pair, mass); see
+        __convergence_dtype__.
+        """
+
+        pairs = self.resolution_pairs(simulations)
+
+        args = []
+        for sim_a, sim_b in pairs:
+            masses = np.linspace(max(sim_a['Mmin30Hz'], sim_b['Mmin30Hz']),
+                    max_mass, nmasses)
+            args.append((sim_a, sim_b, masses, self.settings))
+
+        print >> sys.stdout, "Computing mismatches for %d resolution pairs"%(
+                len(pairs))
+
+        if self.nprocesses > 1:
+            pool = multiprocessing.Pool(self.nprocesses)
+            waveforms = pool.map(_pair_waveforms, args, chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            waveforms = map(_pair_waveforms, args)
+
+        table = np.zeros(len(pairs)*nmasses, dtype=__convergence_dtype__)
+
+        for p, (sim_a, sim_b, masses, _) in enumerate(args):
+
+            tildes_a, tildes_b, ffinals = waveforms[p]
+
+            matches = nrbu.batch_match(tildes_a, tildes_b, self.delta_f,
+                    psd=self.psd, f_min=self.f_min, f_max=1.5*ffinals)
+
+            rows = table[p*nmasses:(p+1)*nmasses]
+            rows['run'] = sim_a['run']
+            rows['wavefile_a'] = os.path.basename(sim_a['wavefile'])
+            rows['wavefile_b'] = os.path.basename(sim_b['wavefile'])
+            rows['mres_a'] = sim_a['mres']
+            rows['mres_b'] = sim_b['mres']
+            rows['mass'] = masses
+            rows['mismatch'] = 1-matches
+
+        return table
+
+def write_table(table, filename):
+    """
+    Write the structured array table (e.g., from convergence_engine) as an
+    ascii file with a header line of column names
+    """
+
+    names = table.dtype.names
+    f = open(filename, 'w')
+    f.write("# %s\n"%(" ".join(names)))
+    for row in table:
+        f.write(" ".join([str(row[name]) for name in names]) + "\n")
+    f.close()
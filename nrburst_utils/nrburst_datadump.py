@@ -34,6 +34,7 @@ import triangle
 
 from pycbc import pnutils
 import nrburst_utils as nrbu
+import nrburst_profile as nrbu_profile
 
 pl.rcParams.update({'axes.labelsize': 16})
 pl.rcParams.update({'xtick.labelsize':16})
@@ -48,9 +49,12 @@ def parser():
     parser.add_option("-t", "--user-tag", type=str, default=None)
     parser.add_option("-m", "--match-threshold", type=float, default=0.0)
     parser.add_option("-c", "--match-lim-high", type=float, default=1.0)
+    nrbu_profile.add_profile_option(parser)
 
     (opts,args) = parser.parse_args()
 
+    nrbu_profile.start_from_options(opts)
+
     return opts, args
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -0,0 +1,747 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_fitfactor.py
+
+Importable driver for the fitting-factor calculation in nrburst_netmatch.py
+and nrburst_match.py: the fitting factor (normalised inner product maximised
+over time, phase, total mass and inclination) of every NR simulation in a
+catalog against every sample of a whitened burst reconstruction.
+
+Nothing is read from the command line or the disk on import, so the driver
+can be called repeatedly from a notebook, a pool worker or a benchmark,
+reusing the loaded catalog, the metadata / PSD caches and the match kernel:
+
+    import nrburst_utils as nrbu
+    import nrburst_fitfactor as nrbu_ff
+
+    config = nrbu.configuration(cp)
+    reconstructions = nrbu_ff.load_reconstructions(config)
+    asds = nrbu_ff.load_asds(config)
+    simulations = nrbu_ff.load_simulations(config)
+
+    matches, masses, inclinations = nrbu_ff.run_fitting_factor(config,
+            reconstructions, simulations, asds)
+
+reconstructions and asds are lists with one entry per detector (H1 and L1 for
+a network analysis, or a single detector): an array of whitened samples (one
+per row) and the ASD on the frequencies of the (datalen, sample_rate) grid.
+"""
+
+import sys, os
+
+import numpy as np
+import scipy.optimize
+import timeit
+
+import nrburst_utils as nrbu
+import nrburst_kernel as nrbu_kernel
+import nrburst_timing as nrbu_timing
+import nrburst_simindex as nrbu_simindex
+import nrburst_asc2npy as nrbu_npy
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Coarse grid for pruning: number of total masses spanning the mass bounds
+# and the inclinations (degrees)
+__prune_nmasses__ = 5
+__prune_inclinations__ = [0.0, 45.0, 90.0]
+
+# Rows of the reconstructions read at a time for stratified_samples
+__energy_block_rows__ = 256
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Inputs
+
+def stratified_samples(reconstruction_data, nsampls, rng=np.random):
+    """
+    Indices of nsampls reconstruction samples, one drawn from each of nsampls
+    equal-sized strata in the network energy (sum of the squared whitened
+    samples over detectors, i.e. the squared reconstruction SNR).  The
+    indices are returned in random order.
+    """
+
+    # In blocks of rows, so memory-mapped reconstructions are not read into
+    # memory all at once
+    nsamples = len(reconstruction_data[0])
+    energy = np.zeros(nsamples)
+    for data in reconstruction_data:
+        for start in xrange(0, nsamples, __energy_block_rows__):
+            block = data[start:start+__energy_block_rows__]
+            energy[start:start+len(block)] += np.einsum('ij,ij->i', block,
+                    block)
+
+    strata = np.array_split(np.argsort(energy), nsampls)
+
+    idx = [stratum[rng.randint(len(stratum))] for stratum in strata]
+
+    return rng.permutation(idx)
+
+def select_samples(reconstruction_data, config, opts=None):
+    """
+    Reduce the reconstruction samples (one per row, one array per detector)
+    according to the algorithm and nsampls in config and, for BayesWave, the
+    --min-sample / --max-sample options.  Sets config.nsampls.
+
+    nsampls samples are drawn without replacement, either uniformly or, if
+    config.sample_selection is 'stratified', stratified by energy (see
+    stratified_samples).  The draws are reproducible if config.sample_seed
+    is set.
+    """
+
+    if config.algorithm=='BW':
+
+        nsamples = len(reconstruction_data[0])
+
+        if config.nsampls != 'all':
+
+            rng = np.random.RandomState(getattr(config, 'sample_seed', None))
+            nsampls = min(config.nsampls, nsamples)
+
+            if getattr(config, 'sample_selection', 'random') == 'stratified':
+                print >> sys.stdout, 'selecting %d of %d samples, stratified '\
+                        'by energy'%(nsampls, nsamples)
+                idx = stratified_samples(reconstruction_data, nsampls, rng)
+            else:
+                print >> sys.stdout, 'reducing sample size (%d of %d)'%(
+                        nsampls, nsamples)
+                idx = rng.permutation(nsamples)[:nsampls]
+
+        elif opts is not None and opts.max_sample is not None:
+
+            print >> sys.stdout, "selecting out samples %d:%d"%(
+                    opts.min_sample, opts.max_sample)
+            idx = slice(opts.min_sample, opts.max_sample+1)
+
+        else:
+            print >> sys.stdout, 'using ALL BW samples (%d)'%nsamples
+            idx = slice(None)
+
+        # Slices of memory-mapped reconstructions are views: samples are only
+        # read when they are used
+        reconstruction_data = [data[idx] for data in reconstruction_data]
+
+    elif config.algorithm in ['CWB', 'HWINJ']:
+
+        reconstruction_data = [[nrbu.extract_wave(np.array(data),
+            config.datalen, config.sample_rate)] for data in
+            reconstruction_data]
+
+    setattr(config, 'nsampls', len(reconstruction_data[0]))
+
+    return reconstruction_data
+
+def load_reconstructions(config, opts=None, ifos=['H1', 'L1']):
+    """
+    Load the reconstructions for the detectors ifos from the paths in config
+    and select samples (see select_samples).  Reconstructions converted with
+    nrburst_asc2npy.py are memory-mapped.
+    """
+
+    print >> sys.stdout,  "Loading data"
+    reconstruction_data = [nrbu_npy.load(getattr(config,
+        '%s_reconstruction'%ifo.lower())) for ifo in ifos]
+
+    return select_samples(reconstruction_data, config, opts)
+
+def load_asds(config, ifos=['H1', 'L1']):
+    """
+    ASDs for the detectors ifos, interpolated to the frequencies of the
+    (datalen, sample_rate) grid in config
+    """
+
+    flen = int(0.5*config.datalen/config.delta_t) + 1
+
+    return [np.sqrt(nrbu.get_psd(getattr(config,
+        '%s_spectral_estimate'%ifo.lower()), 1./config.datalen, flen,
+        interpolation='log').numpy()) for ifo in ifos]
+
+def load_simulations(config, opts=None):
+    """
+    Load the catalog in config, restricted to the simulations whose minimum
+    chirp mass at 30 Hz is within config.min_chirp_mass and, if opts is given,
+    to --simulation-number / --hdf5file.  The NR metadata is read up front.
+    """
+
+    bounds = dict()
+    bounds['Mchirpmin30Hz'] = [-np.inf, config.min_chirp_mass]
+
+    print >> sys.stdout,  '~~~~~~~~~~~~~~~~~~~~~'
+    print >> sys.stdout,  'Selecting Simulations'
+    print >> sys.stdout,  ''
+
+    with nrbu_timing.timer('catalog'):
+        simulations = nrbu.simulation_details(param_bounds=bounds,
+                catdir=config.catalog)
+
+    if opts is not None and opts.simulation_number != "all":
+        setattr(simulations, 'simulations',
+                [simulations.simulations[opts.simulation_number]])
+        setattr(simulations, 'nsimulations', len(simulations.simulations))
+
+    if opts is not None and opts.hdf5file is not None:
+        # Locate the simulation for this file
+        wavefiles = [os.path.basename(sim['wavefile']) for sim in
+            simulations.simulations]
+        setattr(simulations, 'simulations',
+                [simulations.simulations[wavefiles.index(opts.hdf5file)]])
+        setattr(simulations, 'nsimulations', len(simulations.simulations))
+
+    # Read the NR metadata once up front, rather than on each objective
+    # evaluation
+    with nrbu_timing.timer('catalog/metadata'):
+        simulations.prime_metadata_cache()
+
+    return simulations
+
+def output_filename(config, opts, prefix=''):
+    """
+    Name of the results pickle for the run described by config and opts
+    """
+
+    if opts.simulation_number != "all":
+        filename=prefix+opts.user_tag+'_'+config.algorithm+'_nrsim-'+\
+                str(opts.simulation_number)+'.pickle'
+    elif opts.hdf5file is not None:
+        filename=prefix+opts.user_tag+'_'+config.algorithm+'_nrsim-'+\
+                str(opts.hdf5file).replace('.h5','')+'.pickle'
+    else:
+        filename=prefix+opts.user_tag+'_'+config.algorithm+'.pickle'
+
+    if opts.max_sample is not None:
+        filename=filename.replace('.pickle',
+                '-minsamp_%d-maxsamp_%d.pickle'%(opts.min_sample,
+                    opts.max_sample))
+
+    return filename
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Fitting factor
+
+def detector_mismatch(params, nrfile, mass_bounds, rec_data, asds,
+        delta_t=1./1024, f_min=30.0, kernel=None):
+    """
+    1 - match over the detectors with whitened data rec_data[i] and ASD
+    asds[i], with the overlaps and norms summed over detectors as in
+    nrburst_utils.network_match()
+    """
+
+    max_snr = 0.0
+    tmplt_sigmasq = 0.0
+    data_sigmasq = 0.0
+
+    for data, asd in zip(rec_data, asds):
+        snr, h_sigmasq, d_sigmasq = nrbu.single_ifo_match(params,
+                nrfile=nrfile, mass_bounds=mass_bounds, rec_data=data,
+                asd=asd, delta_t=delta_t, f_min=f_min, kernel=kernel)
+        max_snr += snr
+        tmplt_sigmasq += h_sigmasq
+        data_sigmasq += d_sigmasq
+
+    if max_snr==0.0:
+        return 1.0
+
+    return 1 - max_snr / np.sqrt(tmplt_sigmasq*data_sigmasq)
+
+def coarse_match(sim, reconstructions, asds, config, kernel=None,
+        nsamples=1):
+    """
+    Cheap lower bound on the fitting factor of the simulation sim: the best
+    match on a fixed grid of __prune_nmasses__ total masses and the
+    inclinations in __prune_inclinations__, averaged over the first nsamples
+    reconstruction samples
+    """
+
+    min_mass, max_mass = mass_bounds(config, sim)
+    masses = np.linspace(min_mass, max_mass, __prune_nmasses__)
+
+    nsamples = min(nsamples, len(reconstructions[0]))
+
+    best = np.zeros(nsamples)
+    for s in xrange(nsamples):
+        rec_data = [np.array(data[s]) for data in reconstructions]
+        for mass in masses:
+            for inclination in __prune_inclinations__:
+                match = 1-detector_mismatch((mass, inclination),
+                        sim['wavefile'], (min_mass, max_mass), rec_data, asds,
+                        config.delta_t, 30.0, kernel)
+                best[s] = max(best[s], match)
+
+    return best.mean()
+
+def prune_simulations(config, reconstructions, simulations, asds,
+        kernel=None, margin=0.1, nsamples=1):
+    """
+    Coarse stage of the pruned search: the coarse_match() of every simulation.
+    Simulations more than margin below the best coarse match are pruned.
+    Returns (keep, coarse_matches), with keep a boolean array.
+    """
+
+    coarse_matches = np.zeros(simulations.nsimulations)
+
+    with nrbu_timing.timer('prune'):
+        for w, sim in enumerate(simulations.simulations):
+            coarse_matches[w] = coarse_match(sim, reconstructions, asds,
+                    config, kernel=kernel, nsamples=nsamples)
+
+    keep = coarse_matches >= coarse_matches.max() - margin
+
+    print >> sys.stdout, "Pruning: keeping %d/%d simulations within %.3f "\
+            "of the best coarse match (%.3f)"%(sum(keep),
+                    simulations.nsimulations, margin, coarse_matches.max())
+
+    return keep, coarse_matches
+
+def mass_bounds(config, sim):
+    """
+    Total mass range for the simulation sim corresponding to the chirp mass
+    range in config
+    """
+    min_mass = config.min_chirp_mass * sim['eta']**(-3./5.)
+    max_mass = config.max_chirp_mass * sim['eta']**(-3./5.)
+    return min_mass, max_mass
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Surrogate over total mass
+
+def chebyshev_nodes(bounds, nnodes):
+    """
+    The nnodes Chebyshev nodes (of the first kind) on the interval bounds, in
+    increasing order
+    """
+    x = -np.cos(np.pi*(np.arange(nnodes)+0.5)/nnodes)
+    return 0.5*(bounds[0]+bounds[1]) + 0.5*(bounds[1]-bounds[0])*x
+
+def chebyshev_maximum(values, bounds):
+    """
+    Location and value of the maximum on bounds of the polynomial
+    interpolating values at chebyshev_nodes(bounds, len(values)), found from
+    the roots of its derivative
+    """
+
+    nnodes = len(values)
+    x = -np.cos(np.pi*(np.arange(nnodes)+0.5)/nnodes)
+
+    coefs = np.polynomial.chebyshev.chebfit(x, values, nnodes-1)
+
+    candidates = [-1.0, 1.0]
+    if nnodes > 2:
+        roots = np.polynomial.chebyshev.chebroots(
+                np.polynomial.chebyshev.chebder(coefs))
+        candidates += [root.real for root in roots if abs(root.imag) < 1e-10
+                and abs(root.real) <= 1]
+
+    candidates = np.array(candidates)
+    interpolant = np.polynomial.chebyshev.chebval(candidates, coefs)
+    best = np.argmax(interpolant)
+
+    location = 0.5*(bounds[0]+bounds[1]) + 0.5*(bounds[1]-bounds[0])*\
+            candidates[best]
+
+    return location, interpolant[best]
+
+def surrogate_maximise(mismatch, mass_bounds, args=(), nnodes=8,
+        inclination=45.0, niter=2, inclination_bounds=(0.0, 180.0)):
+    """
+    Minimise mismatch((mass, inclination), *args) with a surrogate over mass.
+    Each of niter passes:
+
+        1. evaluates the mismatch at nnodes Chebyshev nodes in mass (at the
+           current inclination) and maximises the interpolating polynomial of
+           the match
+        2. verifies the interpolated maximum with one true evaluation
+        3. optimises the inclination at the best mass found so far
+           (bounded scalar minimisation)
+
+    Returns (minimum mismatch, (mass, inclination), number of evaluations),
+    the minimum being over all the true evaluations.
+    """
+
+    evaluations = []
+    def evaluate(params):
+        value = mismatch(params, *args)
+        evaluations.append((value, tuple(params)))
+        return value
+
+    for i in xrange(niter):
+
+        # Chebyshev interpolant of the match over mass
+        masses = chebyshev_nodes(mass_bounds, nnodes)
+        node_matches = [1-evaluate((mass, inclination)) for mass in masses]
+
+        mass, _ = chebyshev_maximum(node_matches, mass_bounds)
+        evaluate((mass, inclination))
+
+        # Inclination at the best mass so far
+        mass = min(evaluations)[1][0]
+        scipy.optimize.minimize_scalar(lambda incl: evaluate((mass, incl)),
+                bounds=inclination_bounds, method='bounded',
+                options={'xatol':1e-2})
+        inclination = min(evaluations)[1][1]
+
+    best_mismatch, best_params = min(evaluations)
+
+    return best_mismatch, best_params, len(evaluations)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Optimisation
+
+def fit_sample(sim, rec_data, asds, config, kernel=None, verbose=True,
+        rng=np.random):
+    """
+    Fitting factor of the simulation sim for one reconstruction sample
+    (rec_data: one whitened array per detector), starting from a random
+    (mass, inclination) drawn from rng.  Returns (match, mass, inclination).
+
+    The maximisation is over both parameters with Nelder-Mead, or, if
+    config.surrogate_nodes is set, with surrogate_maximise() over that many
+    Chebyshev nodes in mass.
+    """
+
+    min_mass, max_mass = mass_bounds(config, sim)
+
+    # --- Starting point for param maximisation
+    mass_guess = (max_mass - min_mass)*rng.random_sample() + min_mass
+    inclination_guess  = 90*rng.random_sample()
+    init_guess = np.array([mass_guess, inclination_guess])
+
+    if getattr(config, 'surrogate_nodes', None) is not None:
+
+        with nrbu_timing.timer('optimiser'):
+            mismatch, params, nevals = surrogate_maximise(detector_mismatch,
+                    (min_mass, max_mass), args=(sim['wavefile'], (min_mass,
+                        max_mass), rec_data, asds, config.delta_t, 30.0,
+                        kernel), nnodes=config.surrogate_nodes,
+                    inclination=inclination_guess)
+        nrbu_timing.count('optimiser/evaluations', nevals)
+
+        if verbose:
+            print >> sys.stdout, "Surrogate: %d evaluations"%nevals
+
+        return 1-mismatch, params[0], params[1]
+
+    if verbose:
+        print >> sys.stdout, "INITAL GUESS:"
+        print >> sys.stdout, init_guess
+
+    with nrbu_timing.timer('optimiser'):
+        result = scipy.optimize.fmin(detector_mismatch,
+                x0=init_guess,
+                args=(
+                    sim['wavefile'], (min_mass, max_mass), rec_data, asds,
+                    config.delta_t, 30.0, kernel
+                    ), xtol=1e-3, ftol=1e-3, maxfun=10000,
+                full_output=True, retall=True, disp=verbose)
+    nrbu_timing.count('optimiser/iterations', result[2])
+    nrbu_timing.count('optimiser/evaluations', result[3])
+
+    return 1-result[1], result[0][0], result[0][1]
+
+def median_stderr(values):
+    """
+    Standard error of the median of values (large-sample approximation for a
+    normal distribution)
+    """
+    return 1.2533 * np.std(values, ddof=1) / np.sqrt(len(values))
+
+def fit_simulation(sim, reconstructions, asds, config, kernel=None,
+        verbose=True, rng=np.random):
+    """
+    Fitting factors of the simulation sim against every reconstruction
+    sample.  Returns arrays (matches, masses, inclinations) with one entry
+    per sample, or None if the polarisations cannot be generated.
+
+    If config.early_stop_stderr is set, the samples are abandoned once at
+    least config.early_stop_min_samples have been fitted and the standard
+    error of the median fitting factor falls below early_stop_stderr; the
+    results of the remaining samples are NaN.  Posterior samples are chain
+    ordered (and correlated), so with early stopping the samples are visited
+    in a random order seeded by config.sample_seed (default 0).
+    """
+
+    early_stop_stderr = getattr(config, 'early_stop_stderr', None)
+    early_stop_min_samples = max(2, getattr(config, 'early_stop_min_samples',
+        10))
+
+    nsamples = len(reconstructions[0])
+
+    matches = np.zeros(nsamples)
+    masses = np.zeros(nsamples)
+    inclinations = np.zeros(nsamples)
+
+    min_mass, max_mass = mass_bounds(config, sim)
+
+    # Check we can generate the polarisations (in case of errors in the NR
+    # files)
+    mass_guess = (max_mass - min_mass)*rng.random_sample() + min_mass
+    inclination_guess  = 90*rng.random_sample()
+    try:
+        hp, hc = nrbu.get_wf_pols(sim['wavefile'], mass_guess,
+                inclination=inclination_guess, delta_t=config.delta_t)
+    except:
+        print >> sys.stderr, "Polarisation extraction failure, skipping %s"%(
+                sim['wavefile'])
+        return None
+
+    if early_stop_stderr is not None:
+        sample_seed = getattr(config, 'sample_seed', None)
+        order = np.random.RandomState(0 if sample_seed is None else
+                sample_seed).permutation(nsamples)
+    else:
+        order = np.arange(nsamples)
+
+    for n, s in enumerate(order):
+
+        # Read this sample (from disk, if memory-mapped)
+        rec_data = [np.array(data[s]) for data in reconstructions]
+
+        if verbose:
+            print >> sys.stdout, '-----------------------------'
+            print >> sys.stdout, "Evaluating sample waveform %d of %d"%( s,
+                    nsamples )
+            print >> sys.stdout, " NR waveform: %s"%sim['wavefile']
+            print >> sys.stdout, " q=%.2f, a1=%.2f, a2=%.2f"%(sim['q'],
+                    sim['a1'], sim['a2'])
+
+        then = timeit.time.time()
+
+        matches[s], masses[s], inclinations[s] = fit_sample(sim, rec_data,
+                asds, config, kernel=kernel, verbose=verbose, rng=rng)
+
+        if verbose:
+            now = timeit.time.time()
+            print >> sys.stdout,  "...mass optimisation took %.3f sec..."%(
+                    now-then)
+
+            chirp_mass = masses[s]*sim['eta']**(3./5.)
+
+            print >> sys.stdout, ""
+            print >> sys.stdout, "Fit-factor: %.2f"%(matches[s])
+            print >> sys.stdout, "Mchirp=%.2f,  Mtot=%.2f, inclination=%.2f"%(
+                    chirp_mass, masses[s], inclinations[s])
+            print >> sys.stdout, ""
+
+        # Early stopping on the running median
+        fitted = order[:n+1]
+        if early_stop_stderr is not None and n+1 >= early_stop_min_samples \
+                and n+1 < nsamples and \
+                median_stderr(matches[fitted]) < early_stop_stderr:
+
+            remaining = order[n+1:]
+            matches[remaining] = np.nan
+            masses[remaining] = np.nan
+            inclinations[remaining] = np.nan
+
+            nrbu_timing.count('early_stop/samples_skipped', len(remaining))
+
+            print >> sys.stdout, "Median fitting factor %.3f +/- %.3f after "\
+                    "%d/%d samples, stopping"%(np.median(matches[fitted]),
+                            median_stderr(matches[fitted]), n+1, nsamples)
+            break
+
+    if verbose:
+        bestidx=np.nanargmax(matches)
+        chirp_mass = masses[bestidx]*sim['eta']**(3./5.)
+
+        print >> sys.stdout, "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
+        print >> sys.stdout, "Best Match:"
+        print >> sys.stdout, "Fit-factor: %.2f"%(matches[bestidx])
+        print >> sys.stdout, "Mchirp=%.2f,  Mtot=%.2f, inclination=%.2f"%(
+                chirp_mass, masses[bestidx], inclinations[bestidx])
+
+    return matches, masses, inclinations
+
+def _fit_rows(w, simulations, reconstructions, asds, config, kernel,
+        verbose, seed, rows):
+    """
+    Fit simulation w (see fit_simulation) into row w of each array in rows
+    (matches, masses, inclinations).  The rows of a simulation which cannot
+    be generated are set to NaN.  Returns True if the simulation was fitted.
+    """
+
+    sim = simulations.simulations[w]
+
+    if verbose:
+        print >> sys.stdout,  "________________________________"
+        print >> sys.stdout,  "Computing match (%d/%d)"%( w+1,
+                simulations.nsimulations)
+
+    if seed is not None:
+        rng = np.random.RandomState(seed + w)
+    else:
+        rng = np.random
+
+    result = fit_simulation(sim, reconstructions, asds, config,
+            kernel=kernel, verbose=verbose, rng=rng)
+
+    if result is None:
+        for row in rows:
+            row[w] = np.nan
+        return False
+
+    for row, values in zip(rows, result):
+        row[w] = values
+
+    return True
+
+def run_fitting_factor(config, reconstructions, simulations, asds,
+        kernel=None, verbose=True, seed=None):
+    """
+    Fitting factor of every simulation in simulations (a
+    nrburst_utils.simulation_details) against every reconstruction sample.
+
+    reconstructions and asds hold one entry per detector (see module
+    docstring).  A match_kernel for config is created if kernel is None.
+
+    If seed is given, the starting points of the optimisation for simulation
+    w are drawn from RandomState(seed+w), so runs with the same seed (e.g.,
+    different events in nrburst_batchmatch.py) start from the same
+    templates; otherwise they are drawn from numpy.random.
+
+    If config.prune_margin is set, every simulation is first scored with a
+    coarse grid (see prune_simulations) on config.prune_nsamples samples and
+    only those within prune_margin of the best are optimised.  The results
+    of pruned simulations are NaN, and their wavefiles and the coarse matches
+    are recorded in config.pruned_simulations and config.coarse_matches.
+
+    If config.similarity_threshold is set, the simulations are clustered with
+    the catalog similarity index config.similarity_index (see
+    nrburst_simindex) and the cluster representatives are optimised first.
+    Only the clusters whose representative has a median fitting factor
+    within config.similarity_margin of the best representative are
+    expanded; the results of the other members are NaN.  Each cluster is
+    represented by its first member which passes pruning and can be
+    generated.  The clusters and the skipped wavefiles are recorded in
+    config.simulation_clusters and config.skipped_simulations.
+
+    Returns arrays (matches, masses, inclinations) of shape (nsimulations,
+    nsamples).  Simulations whose polarisations cannot be generated are
+    skipped (NaN).
+    """
+
+    nsamples = len(reconstructions[0])
+
+    # Preallocate
+    matches = np.zeros(shape=(simulations.nsimulations, nsamples))
+    masses  = np.zeros(shape=(simulations.nsimulations, nsamples))
+    inclinations  = np.zeros(shape=(simulations.nsimulations, nsamples))
+
+    # Matched filter with FFT plans and data transforms reused across every
+    # objective evaluation (f_min=30 as in nrbu.snr_calc)
+    if kernel is None:
+        kernel = nrbu_kernel.match_kernel(config.delta_t, f_min=30.0,
+                peak_interpolation=config.peak_interpolation)
+
+    # Optional coarse stage
+    keep = np.ones(simulations.nsimulations, dtype=bool)
+    if getattr(config, 'prune_margin', None) is not None:
+        keep, coarse_matches = prune_simulations(config, reconstructions,
+                simulations, asds, kernel=kernel, margin=config.prune_margin,
+                nsamples=getattr(config, 'prune_nsamples', 1))
+
+        matches[~keep] = np.nan
+        masses[~keep] = np.nan
+        inclinations[~keep] = np.nan
+
+        setattr(config, 'coarse_matches', coarse_matches)
+        setattr(config, 'pruned_simulations', [sim['wavefile'] for w, sim in
+            enumerate(simulations.simulations) if not keep[w]])
+
+    # Optional clustering of near-identical simulations; otherwise each
+    # simulation is its own representative
+    clustered = getattr(config, 'similarity_threshold', None) is not None
+    if clustered:
+        index = nrbu_simindex.load_index(config.similarity_index)
+        clusters = nrbu_simindex.cluster_simulations(simulations, index,
+                config.similarity_threshold)
+
+        print >> sys.stdout, "Clustering: %d simulations in %d clusters at "\
+                "match %.3f"%(simulations.nsimulations, len(clusters),
+                        config.similarity_threshold)
+
+        setattr(config, 'simulation_clusters', [[
+            simulations.simulations[w]['wavefile'] for w in cluster] for
+            cluster in clusters])
+    else:
+        clusters = [[w] for w in xrange(simulations.nsimulations)]
+
+    # Pruned simulations are already NaN and never represent a cluster
+    clusters = [[w for w in cluster if keep[w]] for cluster in clusters]
+    for w in np.flatnonzero(~keep):
+        if verbose:
+            print >> sys.stdout, "Pruned %s"%simulations.simulations[w][
+                    'wavefile']
+
+    # Representatives first: the first member of each cluster which can be
+    # fitted (members whose polarisations cannot be generated are NaN)
+    representatives = []
+    for c, cluster in enumerate(clusters):
+        representative = None
+        while cluster and representative is None:
+            w = cluster.pop(0)
+            if _fit_rows(w, simulations, reconstructions, asds, config,
+                    kernel, verbose, seed, (matches, masses, inclinations)):
+                representative = w
+        representatives.append(representative)
+
+    # Then the remaining members of the promising clusters
+    if clustered:
+        # Samples skipped by early stopping are NaN
+        representative_matches = np.array([-np.inf if w is None else
+            np.nanmedian(matches[w]) for w in representatives])
+        promising = representative_matches >= \
+                np.max(representative_matches) - config.similarity_margin
+
+        members = []
+        skipped = []
+        for c, cluster in enumerate(clusters):
+            if promising[c]:
+                members += cluster
+            else:
+                skipped += cluster
+
+        matches[skipped] = np.nan
+        masses[skipped] = np.nan
+        inclinations[skipped] = np.nan
+
+        print >> sys.stdout, "Clustering: expanding %d/%d clusters, "\
+                "skipping %d simulations"%(sum(promising), len(clusters),
+                        len(skipped))
+
+        setattr(config, 'skipped_simulations',
+                [simulations.simulations[w]['wavefile'] for w in skipped])
+
+        for w in members:
+            _fit_rows(w, simulations, reconstructions, asds, config, kernel,
+                    verbose, seed, (matches, masses, inclinations))
+
+    return matches, masses, inclinations
+
+def write_timing(opts, filename):
+    """
+    Print the per-stage timing summary and write the JSON sidecar (if
+    instrumentation is enabled)
+    """
+
+    if not nrbu_timing.enabled():
+        return
+
+    nrbu_timing.report()
+    if opts.timing_file is not None:
+        nrbu_timing.write_json(opts.timing_file)
+    else:
+        nrbu_timing.write_json(filename.replace('.pickle', '_timing.json'))
@@ -34,6 +34,7 @@ import triangle
 
 from pycbc import pnutils
 import nrburst_utils as nrbu
+import nrburst_profile as nrbu_profile
 
 pl.rcParams.update({'axes.labelsize': 16})
 pl.rcParams.update({'xtick.labelsize':16})
@@ -51,9 +52,12 @@ def parser():
     parser.add_option("-u", "--match-clim-upp", type=float, default=0.95)
     parser.add_option("-l", "--match-clim-low", type=float, default=0.90)
     parser.add_option("-L", "--no-plot", action="store_true", default=False)
+    nrbu_profile.add_profile_option(parser)
 
     (opts,args) = parser.parse_args()
 
+    nrbu_profile.start_from_options(opts)
+
     return opts, args
 
 
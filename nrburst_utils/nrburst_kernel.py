@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_kernel.py
+
+Frequency-domain matched-filter kernel for the fitting-factor optimisation.
+
+This computes the same quantities as nrburst_utils.snr_calc() (maximum
+un-normalised overlap and the template / data norms, following the
+pycbc.filter conventions) but:
+
+    - FFT plans and work buffers are allocated once per data length and
+      reused for every template
+    - the band-limited data FFT and its norm are cached per data array, so
+      only the template is transformed on each objective evaluation
+    - the cross-correlation, inverse FFT and peak search are done in place
+      on the preallocated buffers
+
+The peak of the overlap time series can optionally be refined below the
+sampling interval (peak_interpolation='quadratic' or 'sinc'), which makes
+the fitting-factor surface smooth in the template parameters.
+
+pyfftw is used for the FFTs if it is installed, otherwise numpy.fft.
+"""
+
+import sys
+import collections
+
+import numpy as np
+import scipy.optimize
+
+try:
+    import pyfftw
+    _have_fftw = True
+except ImportError:
+    _have_fftw = False
+
+__peak_interpolations__ = [None, 'quadratic', 'sinc']
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+class match_kernel:
+    """
+    Preplanned matched filter for templates and data sampled at delta_t.
+    Overlaps are band-limited to [f_min, f_max) (f_max=None: Nyquist).
+
+    peak_interpolation selects how the maximum of the overlap time series is
+    found:
+
+        None        largest sample (as snr_calc)
+        'quadratic' vertex of a parabola through the largest sample and its
+                    neighbours
+        'sinc'      maximum of the band-limited (Fourier) interpolant of the
+                    overlap within one sample of the largest sample
+
+    Example:
+
+        kernel = match_kernel(1./1024, f_min=30.0)
+        maxsnr, h_sigmasq, d_sigmasq = kernel.snr(htilde, data)
+    """
+
+    def __init__(self, delta_t, f_min=30.0, f_max=None, nthreads=1,
+            ndata_cache=8, peak_interpolation=None):
+
+        if peak_interpolation not in __peak_interpolations__:
+            print >> sys.stderr, "ERROR: peak interpolation %s not recognised"%(
+                    peak_interpolation)
+            print >> sys.stderr, "must be in ", __peak_interpolations__
+            sys.exit(-1)
+
+        self.peak_interpolation = peak_interpolation
+        self.delta_t = delta_t
+        self.f_min = f_min
+        self.f_max = f_max
+        self.nthreads = nthreads
+
+        # FFT plans / buffers keyed by time series length
+        self._plans = dict()
+
+        # Band-limited data FFTs and norms, keyed by (id(data), N)
+        self._data_cache = collections.OrderedDict()
+        self.ndata_cache = ndata_cache
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Plans and caches
+
+    def _band(self, N):
+        """
+        Frequency bin indices [kmin, kmax) for a length N time series
+        (see nrburst_utils.cutoff_indices)
+        """
+        delta_f = 1.0 / (N*self.delta_t)
+        kmin = int(self.f_min / delta_f)
+        kmax = int((N + 1)/2.)
+        if self.f_max is not None:
+            kmax = min(int(self.f_max / delta_f), kmax)
+        return kmin, kmax
+
+    def _plan(self, N):
+        """
+        FFT plans and work buffers for length N, created on first use
+        """
+
+        try:
+            return self._plans[N]
+        except KeyError:
+            pass
+
+        plan = dict()
+        plan['delta_f'] = 1.0 / (N*self.delta_t)
+        plan['band'] = self._band(N)
+
+        if _have_fftw:
+            rfft = pyfftw.builders.rfft(pyfftw.empty_aligned(N,
+                dtype='float64'), threads=self.nthreads)
+            ifft = pyfftw.builders.ifft(pyfftw.empty_aligned(N,
+                dtype='complex128'), threads=self.nthreads)
+
+            plan['real'] = rfft.input_array
+            plan['qtilde'] = ifft.input_array
+            plan['forward'] = rfft
+            plan['inverse'] = ifft
+        else:
+            plan['real'] = np.zeros(N)
+            plan['qtilde'] = np.zeros(N, dtype=complex)
+            plan['forward'] = lambda: np.fft.rfft(plan['real'])
+            plan['inverse'] = lambda: np.fft.ifft(plan['qtilde'])
+
+        plan['qtilde'][:] = 0.0
+        plan['absq'] = np.zeros(N)
+
+        self._plans[N] = plan
+
+        return plan
+
+    def _forward(self, timeseries, N):
+        """
+        FFT of timeseries, zero-padded to length N, scaled by delta_t as in
+        TimeSeries.to_frequencyseries().  The array returned may be a work
+        buffer which is overwritten by the next transform.
+        """
+
+        plan = self._plan(N)
+
+        real = plan['real']
+        real[:len(timeseries)] = timeseries
+        real[len(timeseries):] = 0.0
+
+        tilde = plan['forward']()
+        tilde *= self.delta_t
+
+        return tilde
+
+    def data_tilde(self, data, N):
+        """
+        Return (band-limited FFT, sigmasq) of the time-domain data zero-padded
+        to length N.  Cached for the most recently used data arrays.
+        """
+
+        key = (id(data), N)
+
+        try:
+            cached_data, stilde, d_sigmasq = self._data_cache.pop(key)
+            if cached_data is data:
+                self._data_cache[key] = (cached_data, stilde, d_sigmasq)
+                return stilde, d_sigmasq
+        except KeyError:
+            pass
+
+        kmin, kmax = self._band(N)
+        delta_f = 1.0 / (N*self.delta_t)
+
+        stilde = np.array(self._forward(data, N)[kmin:kmax])
+        d_sigmasq = 4.0 * delta_f * np.vdot(stilde, stilde).real
+
+        # Keep a reference to data so its id can't be reused while cached
+        self._data_cache[key] = (data, stilde, d_sigmasq)
+        while len(self._data_cache) > self.ndata_cache:
+            self._data_cache.popitem(last=False)
+
+        return stilde, d_sigmasq
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Overlaps
+
+    def snr(self, htilde, data, N=None):
+        """
+        Return (maxsnr, h_sigmasq, d_sigmasq) for the frequency-domain
+        template htilde (length N/2+1) and the time-domain data, as in
+        nrburst_utils.snr_calc(): maxsnr is the maximum of the un-normalised
+        overlap, so the match is 4*delta_f*maxsnr/sqrt(h_sigmasq*d_sigmasq).
+        N defaults to 2*(len(htilde)-1).
+        """
+
+        if N is None:
+            N = 2*(len(htilde)-1)
+        plan = self._plan(N)
+        kmin, kmax = plan['band']
+        delta_f = plan['delta_f']
+
+        stilde, d_sigmasq = self.data_tilde(data, N)
+
+        hband = htilde[kmin:kmax]
+        h_sigmasq = 4.0 * delta_f * np.vdot(hband, hband).real
+
+        # Cross-correlation (zero outside the band), inverse FFT and peak
+        qtilde = plan['qtilde']
+        np.conjugate(hband, out=qtilde[kmin:kmax])
+        qtilde[kmin:kmax] *= stilde
+
+        q = plan['inverse']()
+        absq = plan['absq']
+        np.abs(q, out=absq)
+
+        # numpy / FFTW inverse transforms are normalised by 1/N; pycbc's are
+        # not.  Like snr_calc (pycbc.filter.matched_filter_core) this is the
+        # un-normalised overlap.
+        maxsnr = N * self._peak(plan, absq)
+
+        return maxsnr, h_sigmasq, d_sigmasq
+
+    def _peak(self, plan, absq):
+        """
+        Maximum of |q| (the inverse FFT of plan['qtilde']), refined according
+        to self.peak_interpolation
+        """
+
+        idx = absq.argmax()
+        peak = absq[idx]
+
+        if self.peak_interpolation is None:
+            return peak
+
+        N = len(absq)
+
+        if self.peak_interpolation == 'quadratic':
+
+            ym1 = absq[(idx-1) % N]
+            yp1 = absq[(idx+1) % N]
+
+            curvature = ym1 - 2*peak + yp1
+            if curvature >= 0:
+                return peak
+
+            offset = 0.5*(ym1 - yp1)/curvature
+            return peak - 0.25*(ym1 - yp1)*offset
+
+        # sinc: evaluate the inverse DFT of the band-limited correlation at
+        # fractional sample offsets from idx
+        kmin, kmax = plan['band']
+        qband = plan['qtilde'][kmin:kmax]
+        phase = 2j*np.pi*np.arange(kmin, kmax)/N
+
+        def neg_absq(offset):
+            return -abs(np.dot(qband, np.exp(phase*(idx+offset)))) / N
+
+        result = scipy.optimize.minimize_scalar(neg_absq, bounds=(-1, 1),
+                method='bounded', options={'xatol':1e-3})
+
+        return max(peak, -result.fun)
+
+    def whitened_snr(self, tmplt, data, asd):
+        """
+        snr() for the time-domain template tmplt, whitened by asd in the
+        frequency domain.  tmplt and data are zero-padded to the longer of the
+        two, as in nrburst_utils.single_ifo_match().
+        """
+
+        N = max(len(tmplt), len(data))
+
+        # Make sure the data FFT is cached before the template overwrites the
+        # forward transform buffer
+        self.data_tilde(data, N)
+
+        htilde = self._forward(tmplt, N)
+        htilde /= asd
+
+        return self.snr(htilde, data, N=N)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_masssweep.py
+
+Mismatch between NR waveforms and an approximant as a function of total mass.
+
+The time/frequency grid is fixed by (delta_t, datalen), so the noise PSD is
+computed once per engine.  The NR and approximant waveforms for every mass are
+generated in a pool of worker processes and all matches are then computed in
+a single batch (see nrburst_utils.batch_match).
+
+Usage (as a script):
+
+    nrburst_masssweep.py --catalog <gatech_hdf5> --asd-file <asd> \\
+            [--simulation GATECH0006.h5 ...] [--approximant SEOBNRv2]
+"""
+
+import sys, os
+from optparse import OptionParser
+import multiprocessing
+
+import numpy as np
+
+import pycbc.types
+from pycbc.waveform import get_td_waveform, get_fd_waveform
+from pycbc.waveform import td_approximants, fd_approximants
+from pycbc.waveform import utils as wfutils
+from pycbc import pnutils
+
+import nrburst_utils as nrbu
+import nrburst_profile as nrbu_profile
+import nrburst_nrasc as nrbu_asc
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+def final_frequency(sim, mass):
+    """
+    Estimate of the final (ringdown) frequency of the simulation sim at total
+    mass, from its aligned spin components
+    """
+
+    mass1, mass2 = pnutils.mtotal_eta_to_mass1_mass2(mass, sim['eta'])
+
+    return pnutils.get_final_freq('SEOBNRv2', mass1, mass2, sim['spin1z'],
+            sim['spin2z'])
+
+def nr_frequency_series(wavefile, mass, f_lower, settings):
+    """
+    Tapered NR plus polarisation from wavefile at total mass, as a frequency
+    series (numpy array) on the (delta_t, tlen) grid in settings
+    """
+
+    delta_t = settings['delta_t']
+    tlen = settings['tlen']
+
+    hplus_NR, _ = nrbu.get_wf_pols(wavefile, mass,
+            inclination=settings['inclination'], delta_t=delta_t,
+            f_lower=f_lower, distance=settings['distance'])
+    hplus_NR = wfutils.taper_timeseries(hplus_NR, 'TAPER_STARTEND')
+
+    return np.fft.rfft(hplus_NR.data[:tlen], n=tlen) * delta_t
+
+def _generate_waveforms(args):
+    """
+    Worker: generate the NR and approximant plus polarisations for a single
+    simulation and total mass, and return their frequency series (on the
+    engine's grid) along with the estimated final frequency.
+    """
+
+    sim, mass, min_mass, settings = args
+
+    delta_t = settings['delta_t']
+    tlen = settings['tlen']
+    flen = tlen/2 + 1
+    delta_f = 1.0 / (tlen*delta_t)
+
+    mass1, mass2 = pnutils.mtotal_eta_to_mass1_mass2(mass, sim['eta'])
+
+    # Estimate ffinal
+    ffinal = final_frequency(sim, mass)
+
+    # --- NR
+    Hplus_NR = nr_frequency_series(sim['wavefile'], mass, 30.0001 * min_mass /
+            mass, settings)
+
+    # --- Approximant
+    approx = settings['approx']
+
+    if approx in td_approximants():
+
+        hplus_approx, _ = get_td_waveform(approximant=approx,
+                distance=settings['distance'],
+                mass1=mass1,
+                mass2=mass2,
+                spin1x=0.0,
+                spin2x=0.0,
+                spin1y=0.0,
+                spin2y=0.0,
+                spin1z=sim['spin1z'],
+                spin2z=sim['spin2z'],
+                inclination=settings['inclination'],
+                f_lower=settings['f_low_approx'] * min_mass / mass,
+                delta_t=delta_t)
+
+        hplus_approx = wfutils.taper_timeseries(hplus_approx, 'TAPER_STARTEND')
+        hplus_approx = wfutils.taper_timeseries(hplus_approx, 'TAPER_START')
+
+        Hplus_approx = np.fft.rfft(hplus_approx.data[:tlen], n=tlen) * delta_t
+
+    elif approx in fd_approximants():
+
+        Hplus_approx, _ = get_fd_waveform(approximant=approx,
+                distance=settings['distance'],
+                mass1=mass1,
+                mass2=mass2,
+                spin1x=sim['spin1x'],
+                spin2x=sim['spin2x'],
+                spin1y=sim['spin1y'],
+                spin2y=sim['spin2y'],
+                spin1z=sim['spin1z'],
+                spin2z=sim['spin2z'],
+                inclination=settings['inclination'],
+                f_lower=10,
+                delta_f=delta_f)
+
+        Hplus_approx.resize(flen)
+        Hplus_approx = np.array(Hplus_approx.data)
+
+    else:
+        raise ValueError("approximant %s not recognised"%approx)
+
+    return Hplus_NR, Hplus_approx, ffinal
+
+
+class mismatch_engine:
+    """
+    NR vs approximant mismatches over a grid of total masses, with the PSD
+    precomputed once for the engine's (delta_t, datalen) grid
+    """
+
+    def __init__(self, asd_file, approx='SEOBNRv2', delta_t=1./4096,
+            datalen=16.0, f_min=30.0, f_low_approx=20, inclination=0.0,
+            distance=500, nprocesses=1):
+
+        if approx not in td_approximants() and approx not in fd_approximants():
+            print >> sys.stderr, "ERROR: approximant %s not recognised"%approx
+            sys.exit(-1)
+
+        self.approx = approx
+        self.delta_t = delta_t
+        self.datalen = datalen
+        self.f_min = f_min
+
+        self.tlen = int(datalen / delta_t)
+        self.delta_f = 1.0 / (self.tlen*delta_t)
+        self.sample_frequencies = np.arange(self.tlen/2 + 1) * self.delta_f
+
+        self.settings = {'approx':approx, 'delta_t':delta_t, 'tlen':self.tlen,
+                'f_low_approx':f_low_approx, 'inclination':inclination,
+                'distance':distance}
+
+        # Interpolate the ASD to the frequency grid once; every match
+        # computed by this engine shares it
+        self.psd = nrbu.get_psd(asd_file, self.delta_f,
+                len(self.sample_frequencies)).numpy()
+
+        self.nprocesses = nprocesses
+        if nprocesses > 1:
+            self.pool = multiprocessing.Pool(nprocesses)
+        else:
+            self.pool = None
+
+    def close(self):
+        """
+        Shut down the worker pool
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _map(self, func, args):
+        if self.pool is None:
+            return map(func, args)
+        else:
+            return self.pool.map(func, args)
+
+    def mass_grid(self, sim, nmasses=5, max_mass=500.0):
+        """
+        Evenly spaced masses from the lowest mass for which the simulation
+        starts at 30 Hz up to max_mass
+        """
+        return np.linspace(sim['Mmin30Hz'], max_mass, nmasses)
+
+    def mismatches(self, sim, masses):
+        """
+        Return the mismatches (1-match) between the NR plus polarisation of the
+        simulation sim and the approximant at each total mass in masses.  Matches
+        are noise-weighted between f_min and 1.5 x the estimated final
+        frequency at each mass.
+        """
+
+        masses = np.atleast_1d(masses)
+
+        args = [(sim, mass, min(masses), self.settings) for mass in masses]
+        waveforms = self._map(_generate_waveforms, args)
+
+        nr_tildes = np.array([wf[0] for wf in waveforms])
+        approx_tildes = np.array([wf[1] for wf in waveforms])
+        upp_bounds = 1.5*np.array([wf[2] for wf in waveforms])
+
+        matches = nrbu.batch_match(approx_tildes, nr_tildes, self.delta_f,
+                psd=self.psd, f_min=self.f_min, f_max=upp_bounds)
+
+        return 1-matches
+
+    def error_band_mismatches(self, sim, errors_file, masses):
+        """
+        Mismatches between the NR waveform in the ascii errors_file (see
+        nrburst_nrasc) and the same waveform with its amplitude and phase errors
+        added (upper) and subtracted (lower), at each total mass in masses.
+        Returns (upper mismatches, lower mismatches).
+        """
+
+        masses = np.atleast_1d(masses)
+        nmasses = len(masses)
+
+        times_codeunits, NR_codeunits = nrbu_asc.load_NR_asc(errors_file)
+        NR_resampled, NR_lengths = nrbu_asc.resample_NR(times_codeunits,
+                NR_codeunits, masses, delta_t=self.delta_t)
+
+        hplus = np.zeros(shape=(nmasses, self.tlen))
+        hcross = np.zeros(shape=(nmasses, self.tlen))
+        dAmpbyAmp = np.zeros(shape=(nmasses, self.tlen))
+        dphi = np.zeros(shape=(nmasses, self.tlen))
+
+        for m in xrange(nmasses):
+
+            nsamp = min(NR_lengths[m], self.tlen)
+
+            hplus_NR = wfutils.taper_timeseries(pycbc.types.TimeSeries(
+                NR_resampled[0,m,:NR_lengths[m]], self.delta_t), 'TAPER_STARTEND')
+            hcross_NR = wfutils.taper_timeseries(pycbc.types.TimeSeries(
+                NR_resampled[1,m,:NR_lengths[m]], self.delta_t), 'TAPER_STARTEND')
+
+            hplus[m,:nsamp] = hplus_NR.data[:nsamp]
+            hcross[m,:nsamp] = hcross_NR.data[:nsamp]
+            dAmpbyAmp[m,:nsamp] = NR_resampled[2,m,:nsamp]
+            dphi[m,:nsamp] = NR_resampled[3,m,:nsamp]
+
+        # Convert to amplitude/phase, add/subtract errors
+        amp_NR = np.sqrt(hplus**2 + hcross**2)
+        phi_NR = np.unwrap(np.arctan2(hcross, hplus), axis=1)
+
+        hplus_deltaUpp = np.real(amp_NR*(1+dAmpbyAmp) * np.exp(1j*(phi_NR+dphi)))
+        hplus_deltaLow = np.real(amp_NR*(1-dAmpbyAmp) * np.exp(1j*(phi_NR-dphi)))
+
+        Hplus = np.fft.rfft(hplus, axis=1) * self.delta_t
+        Hplus_deltaUpp = np.fft.rfft(hplus_deltaUpp, axis=1) * self.delta_t
+        Hplus_deltaLow = np.fft.rfft(hplus_deltaLow, axis=1) * self.delta_t
+
+        upp_bounds = 1.5*np.array([final_frequency(sim, mass) for mass in
+            masses])
+
+        match_deltaUpp = nrbu.batch_match(Hplus, Hplus_deltaUpp, self.delta_f,
+                psd=self.psd, f_min=self.f_min, f_max=upp_bounds)
+        match_deltaLow = nrbu.batch_match(Hplus, Hplus_deltaLow, self.delta_f,
+                psd=self.psd, f_min=self.f_min, f_max=upp_bounds)
+
+        return 1-match_deltaUpp, 1-match_deltaLow
+
+    def catalog_mismatches(self, simulations, nmasses=5, max_mass=500.0):
+        """
+        Mismatch vs mass for every simulation in simulations (a list of
+        simulation dictionaries).  Returns a list of (masses, mismatches)
+        """
+
+        results = []
+        for s, sim in enumerate(simulations):
+            print >> sys.stdout, "Computing mismatches for %s (%d/%d)"%(
+                    sim['wavefile'], s+1, len(simulations))
+            masses = self.mass_grid(sim, nmasses=nmasses, max_mass=max_mass)
+            results.append((masses, self.mismatches(sim, masses)))
+
+        return results
+
+
+def parser():
+
+    # --- Command line input
+    parser = OptionParser()
+    parser.add_option("-c", "--catalog", type=str, default=None)
+    parser.add_option("-n", "--asd-file", type=str, default=None)
+    parser.add_option("-a", "--approximant", type=str, default="SEOBNRv2")
+    parser.add_option("-s", "--simulation", type=str, action="append",
+            default=None)
+    parser.add_option("--n-mass-points", type=int, default=5)
+    parser.add_option("--max-mass", type=float, default=500.0)
+    parser.add_option("--sample-rate", type=int, default=4096)
+    parser.add_option("--datalen", type=float, default=16.0)
+    parser.add_option("-p", "--nprocesses", type=int, default=1)
+    nrbu_profile.add_profile_option(parser)
+
+    (opts,args) = parser.parse_args()
+
+    nrbu_profile.start_from_options(opts)
+
+    if opts.catalog is None or opts.asd_file is None:
+        print >> sys.stderr, "ERROR: require --catalog and --asd-file"
+        sys.exit(-1)
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    simulations = nrbu.simulation_details(catdir=opts.catalog)
+
+    sims = simulations.simulations
+    if opts.simulation is not None:
+        sims = [sim for sim in sims if os.path.basename(sim['wavefile']) in
+                opts.simulation]
+
+    engine = mismatch_engine(opts.asd_file, approx=opts.approximant,
+            delta_t=1./opts.sample_rate, datalen=opts.datalen,
+            nprocesses=opts.nprocesses)
+
+    results = engine.catalog_mismatches(sims, nmasses=opts.n_mass_points,
+            max_mass=opts.max_mass)
+
+    engine.close()
+
+    print >> sys.stdout, "# wavefile mass mismatch(%)"
+    for sim, (masses, mismatches) in zip(sims, results):
+        for mass, mismatch in zip(masses, mismatches):
+            print >> sys.stdout, "%s %.2f %.4f"%(
+                    os.path.basename(sim['wavefile']), mass, 100*mismatch)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
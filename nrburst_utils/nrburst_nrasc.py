@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_nrasc.py
+
+Loading and mass-scaling of the ASCII NR strain + error files (e.g., the
+Strain_Simframe_*.asc files in gatech_data), which have columns:
+
+    t_sim  h_+  h_x  AmpErr  PhsErr
+
+all in code units.
+"""
+
+import os
+
+import numpy as np
+
+import lal
+import pycbc.types
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Names of the data columns following t_sim, in file order
+__nrasc_channels__ = ['hplus', 'hcross', 'dAmpbyAmp', 'dphi']
+
+def load_NR_asc(file, cache=True):
+    """
+    Parse the NR ascii file once and return (times_codeunits, channels), where
+    channels is a (4, N) array with rows ordered as __nrasc_channels__.
+
+    With cache=True the parsed data is saved to <file>.npy and subsequent calls
+    load that binary copy instead of re-parsing the ascii (the cache is
+    refreshed if the ascii file is newer).
+    """
+
+    cache_file = file + '.npy'
+
+    if cache and os.path.exists(cache_file) and \
+            os.path.getmtime(cache_file) >= os.path.getmtime(file):
+        data = np.load(cache_file)
+    else:
+        data = np.loadtxt(file)
+        if cache:
+            try:
+                np.save(cache_file, data)
+            except IOError:
+                # e.g., read-only data directory; just don't cache
+                pass
+
+    times_codeunits = data[:,0]
+    channels = np.array(data[:,1:1+len(__nrasc_channels__)].T)
+
+    return times_codeunits, channels
+
+def parse_NR_asc(file):
+    """
+    Return (times_codeunits, hplus, hcross, dAmpbyAmp, dphi) from the NR ascii
+    file
+    """
+
+    times_codeunits, channels = load_NR_asc(file)
+
+    return (times_codeunits, channels[0], channels[1], channels[2],
+            channels[3])
+
+def resample_NR(times_codeunits, channels, masses, delta_t=1./2048):
+    """
+    Scale NR data in code units to each total mass in masses and resample at
+    delta_t.  All channels and masses are interpolated together.
+
+    channels is a (nchannels, N) array (e.g., from load_NR_asc) or a single
+    channel.  Returns (resampled, lengths): resampled is a (nchannels, nmasses,
+    nmax) array (or (nmasses, nmax) for a single channel) and lengths[m] is the
+    number of valid samples for masses[m]; samples beyond that are zero.
+
+    Each channel is linearly interpolated from NR_datalen samples evenly spread
+    over [0, NR_datalen*SI_deltaT_of_NR], as in the original scale_NR().
+    """
+
+    channels = np.asarray(channels)
+    single_channel = channels.ndim == 1
+    channels = np.atleast_2d(channels)
+
+    masses = np.atleast_1d(masses)
+
+    NR_deltaT = np.diff(times_codeunits)[0]
+    NR_datalen = len(times_codeunits)
+    SI_deltaT_of_NR = masses * lal.MTSUN_SI * NR_deltaT
+
+    # Duration of the scaled waveform and the spacing of the NR samples
+    durations = NR_datalen*SI_deltaT_of_NR
+    spacings = durations / (NR_datalen-1)
+
+    # Number of samples in np.arange(0, duration, delta_t)
+    lengths = np.array(np.ceil(durations / delta_t), dtype=int)
+    nmax = lengths.max()
+
+    interp_times = np.arange(nmax) * delta_t
+
+    # Fractional index of each output sample in the NR data
+    frac_idx = interp_times[None,:] / spacings[:,None]
+    lower = np.array(np.floor(frac_idx), dtype=int)
+    lower = np.clip(lower, 0, NR_datalen-2)
+    weight = np.clip(frac_idx - lower, 0.0, 1.0)
+
+    resampled = channels[:, lower] * (1.0-weight) + \
+            channels[:, lower+1] * weight
+
+    # Zero beyond the end of each waveform
+    resampled *= np.arange(nmax)[None,:] < lengths[:,None]
+
+    if single_channel:
+        resampled = resampled[0]
+
+    return resampled, lengths
+
+def scale_NR(times_codeunits, wave, mass, delta_t=1./2048):
+    """
+    Scale a single NR channel to total mass and return it as a TimeSeries
+    """
+
+    resampled, lengths = resample_NR(times_codeunits, wave, mass,
+            delta_t=delta_t)
+
+    return pycbc.types.TimeSeries(resampled[0,:lengths[0]], delta_t)
+
@@ -31,6 +31,7 @@ import numpy as np
 
 from pycbc import pnutils
 import nrburst_utils as nrbu
+import nrburst_profile as nrbu_profile
 
 from matplotlib import pyplot as pl
 pl.rcParams.update({'axes.labelsize': 16})
@@ -49,9 +50,12 @@ def parser():
     parser.add_option("-u", "--match-clim-upp", type=float, default=0.95)
     parser.add_option("-l", "--match-clim-low", type=float, default=0.90)
     parser.add_option("-L", "--no-plot", action="store_true", default=False)
+    nrbu_profile.add_profile_option(parser)
 
     (opts,args) = parser.parse_args()
 
+    nrbu_profile.start_from_options(opts)
+
     return opts, args
 
 
@@ -75,13 +79,15 @@ if opts.user_tag is None:
 # Manipulation and derived FOMs
 #
 
-for m in matches:
-    m[np.isnan(m)]=0.0
+# Simulations pruned from the search (see nrburst_fitfactor) have no matches;
+# samples skipped by early stopping are NaN and are left out of the statistics
+pruned = np.isnan(matches).all(axis=1)
 
 # Remove NR waveforms in which the mean match was less than some threshold
-mean_matches = np.mean(matches, axis=1)
+mean_matches = np.zeros(len(matches))
+mean_matches[~pruned] = np.nanmean(matches[~pruned], axis=1)
 
-nonzero_match = mean_matches>=opts.match_threshold
+nonzero_match = (mean_matches>=opts.match_threshold) * ~pruned
 matches = matches[nonzero_match]
 masses = masses[nonzero_match]
 
@@ -91,12 +97,12 @@ nsimulations_goodmatch = len(simulations_goodmatch)
 
 
 # Continue
-mean_matches = np.mean(matches, axis=1)
-median_matches = np.median(matches, axis=1)
-std_matches = np.std(matches, axis=1)
+mean_matches = np.nanmean(matches, axis=1)
+median_matches = np.nanmedian(matches, axis=1)
+std_matches = np.nanstd(matches, axis=1)
 
-median_masses = np.median(masses, axis=1)
-std_masses = np.std(masses, axis=1)
+median_masses = np.nanmedian(masses, axis=1)
+std_masses = np.nanstd(masses, axis=1)
 
 # --- Preallocate
 mass_ratios = np.zeros(nsimulations_goodmatch)
@@ -139,13 +145,13 @@ for s, sim in enumerate(simulations_goodmatch):
         chirp_masses[s,n] = masses[s,n] * sim['eta']**(3./5) 
 
     mass1, mass2 = \
-            pnutils.mchirp_eta_to_mass1_mass2(np.median(chirp_masses[s,:]),
+            pnutils.mchirp_eta_to_mass1_mass2(np.nanmedian(chirp_masses[s,:]),
                     sim['eta'])
     chieff[s] = pnutils.phenomb_chi(mass1, mass2, sim['spin1z'],
             sim['spin2z'])
 
-median_chirp_masses = np.median(chirp_masses, axis=1)
-std_chirp_masses    = np.std(chirp_masses, axis=1)
+median_chirp_masses = np.nanmedian(chirp_masses, axis=1)
+std_chirp_masses    = np.nanstd(chirp_masses, axis=1)
 
 matchsort = np.argsort(median_matches)
 print "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_profile.py
+
+Whole-run profiling for the command-line scripts.  Two profilers are
+available:
+
+    cprofile    deterministic profile (cProfile), written as a .pstats file
+                for pstats / snakeviz / gprof2dot
+    sample      statistical profile from a SIGPROF interval timer, written as
+                collapsed stacks ("frame;frame;frame count" per line) for
+                flamegraph.pl / speedscope
+
+The profile starts when start() is called and is written when the process
+exits.  Scripts with an OptionParser get the options with
+add_profile_option() and start the profile with start_from_options():
+
+    --profile cprofile|sample  profiler to use
+    --profile-file FILE        output file (default:
+                               <script>_<pid>.pstats / .collapsed)
+
+Alternatively, set NRBURST_PROFILE=cprofile|sample (and optionally
+NRBURST_PROFILE_FILE) in the environment to profile any script which imports
+this module (including via nrburst_utils) from the point of import.
+
+Only the parent process is profiled; multiprocessing workers are not.
+"""
+
+import os
+import sys
+import atexit
+import signal
+import cProfile
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+__profile_modes__ = ['cprofile', 'sample']
+
+__profile_suffixes__ = {'cprofile':'.pstats', 'sample':'.collapsed'}
+
+# Sampling interval (s) for the sample profiler
+__sample_interval__ = 0.005
+
+_state = {'mode':None, 'profiler':None, 'stacks':None}
+
+def add_profile_option(parser):
+    """
+    Add --profile and --profile-file to the OptionParser parser
+    """
+    parser.add_option("--profile", type="choice", choices=__profile_modes__,
+            default=None, help="profile the run (%s)"%(
+                '|'.join(__profile_modes__)))
+    parser.add_option("--profile-file", type=str, default=None)
+
+def start_from_options(opts):
+    """
+    Start the profiler selected by --profile, if any
+    """
+    if getattr(opts, 'profile', None) is not None:
+        start(opts.profile, getattr(opts, 'profile_file', None))
+
+def default_output(mode):
+    """
+    Output file for mode: <script>_<pid><suffix> in the working directory
+    """
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+    return '%s_%d%s'%(script, os.getpid(), __profile_suffixes__[mode])
+
+def start(mode, output=None):
+    """
+    Start profiling with mode (one of __profile_modes__) and write the profile
+    to output when the process exits.  Only one profile can run per process.
+    """
+
+    if mode not in __profile_modes__:
+        print >> sys.stderr, "ERROR: profile mode %s not recognised"%mode
+        print >> sys.stderr, "must be in ", __profile_modes__
+        sys.exit(-1)
+
+    if _state['mode'] is not None:
+        return
+
+    if output is None:
+        output = default_output(mode)
+
+    _state['mode'] = mode
+
+    if mode == 'cprofile':
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+        atexit.register(_write_cprofile, output)
+
+    elif mode == 'sample':
+        _state['stacks'] = dict()
+        signal.signal(signal.SIGPROF, _sample)
+        # Restart system calls interrupted by the sampler, rather than
+        # failing them with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, __sample_interval__,
+                __sample_interval__)
+        atexit.register(_write_samples, output)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# cProfile
+
+def _write_cprofile(output):
+
+    profiler = _state['profiler']
+    profiler.disable()
+    profiler.dump_stats(output)
+
+    print >> sys.stderr, "Profile written to %s"%output
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Sampling profiler
+
+def _frame_label(frame):
+    code = frame.f_code
+    return '%s (%s:%d)'%(code.co_name, os.path.basename(code.co_filename),
+            code.co_firstlineno)
+
+def _sample(signum, frame):
+    """
+    SIGPROF handler: record the current stack
+    """
+
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+
+    stack = ';'.join(reversed(labels))
+
+    stacks = _state['stacks']
+    stacks[stack] = stacks.get(stack, 0) + 1
+
+def _write_samples(output):
+
+    signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    f = open(output, 'w')
+    for stack in sorted(_state['stacks'].keys()):
+        f.write('%s %d\n'%(stack, _state['stacks'][stack]))
+    f.close()
+
+    print >> sys.stderr, "Profile (%d samples) written to %s"%(
+            sum(_state['stacks'].values()), output)
+
+# Configuration from the environment
+if os.environ.get('NRBURST_PROFILE'):
+    start(os.environ['NRBURST_PROFILE'],
+            os.environ.get('NRBURST_PROFILE_FILE'))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_simindex.py
+
+Catalog similarity index: the matches (maximised over time and phase) between
+every pair of simulations in an NR catalog, for face-on waveforms at a common
+reference total mass.  The index is built once per catalog and saved as
+similarity_index.npz next to the catalog README.txt:
+
+    nrburst_simindex.py [options] /path/to/catalog
+
+Many simulations differ only slightly in spin or mass ratio and have nearly
+identical fitting factors.  The match drivers (see nrburst_fitfactor) use the
+index to group the simulations into clusters whose members all match their
+representative to better than a threshold, optimise the representatives
+first and only expand the clusters whose representatives fit well.
+"""
+
+import sys, os
+from optparse import OptionParser
+
+import numpy as np
+
+import nrburst_utils as nrbu
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+__index_filename__ = 'similarity_index.npz'
+
+def index_file(catdir):
+    """
+    Location of the similarity index for the catalog in catdir
+    """
+    return os.path.join(catdir, __index_filename__)
+
+def build_index(simulations, reference_mass=None, delta_t=1./1024,
+        f_min=30.0, asd_file=None, verbose=True):
+    """
+    Pairwise matches between the simulations in simulations (a
+    nrburst_utils.simulation_details) for face-on waveforms of total mass
+    reference_mass (default: the largest Mmin30Hz in the catalog, so that
+    every waveform starts below f_min).  The matches are noise-weighted with
+    the spectrum in asd_file, if given.
+
+    Simulations whose polarisations cannot be generated are reported and left
+    out of the index (cluster_simulations treats them as clusters of one).
+
+    Returns (matches, reference_mass, wavefiles), with wavefiles the
+    simulations in the rows of matches.
+    """
+
+    if reference_mass is None:
+        reference_mass = max([sim['Mmin30Hz'] for sim in
+            simulations.simulations])
+
+    templates = []
+    wavefiles = []
+    for w, sim in enumerate(simulations.simulations):
+        if verbose:
+            print >> sys.stdout, "Generating %s (%d/%d)"%(sim['wavefile'],
+                    w+1, simulations.nsimulations)
+        try:
+            hp, _ = nrbu.get_wf_pols(sim['wavefile'], reference_mass,
+                    inclination=0.0, delta_t=delta_t, f_lower=f_min)
+        except:
+            print >> sys.stderr, "Polarisation extraction failure, leaving "\
+                    "%s out of the index"%(sim['wavefile'])
+            continue
+        templates.append(hp.numpy())
+        wavefiles.append(sim['wavefile'])
+
+    # Zero-pad so that the circular correlations do not wrap around
+    N = template_length(templates)
+    padded = np.zeros(shape=(len(templates), N))
+    for w, template in enumerate(templates):
+        padded[w, :len(template)] = template
+
+    psd = None
+    if asd_file is not None:
+        psd = nrbu.get_psd(asd_file, 1./(N*delta_t), N/2+1,
+                interpolation='log').numpy()
+
+    matches = np.eye(len(templates))
+    for w in xrange(len(templates)-1):
+        matches[w, w+1:] = nrbu.batch_timeseries_match(padded[w],
+                padded[w+1:], delta_t, psd=psd, f_min=f_min)
+        matches[w+1:, w] = matches[w, w+1:]
+
+    return matches, reference_mass, wavefiles
+
+def template_length(templates):
+    """
+    Power of two at least twice the length of the longest template
+    """
+    return int(2**np.ceil(np.log2(2*max([len(t) for t in templates]))))
+
+def save_index(filename, matches, wavefiles, reference_mass, delta_t,
+        f_min):
+    """
+    Write the index to the .npz file filename; wavefiles are the simulations
+    in the rows of matches.  Simulations are identified by the basenames of
+    their wavefiles so the catalog can be moved.
+    """
+
+    wavefiles = np.array([os.path.basename(wavefile) for wavefile in
+        wavefiles])
+
+    np.savez(filename, matches=matches, wavefiles=wavefiles,
+            reference_mass=reference_mass, delta_t=delta_t, f_min=f_min)
+
+def load_index(filename):
+    """
+    Read the index in filename: a dictionary of the matches, wavefiles
+    (basenames), reference_mass, delta_t and f_min
+    """
+
+    if not os.path.exists(filename):
+        print >> sys.stderr, "ERROR: similarity index %s not found"%filename
+        print >> sys.stderr, "build it with nrburst_simindex.py"
+        sys.exit(-1)
+
+    data = np.load(filename)
+    index = dict([(key, data[key]) for key in data.files])
+    data.close()
+
+    return index
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Clustering
+
+def leader_clusters(matches, threshold):
+    """
+    Leader clustering of the match matrix matches: in order, each simulation
+    joins the first cluster whose leader it matches to at least threshold, or
+    else leads a new cluster.  Returns a list of clusters (lists of indices,
+    the leader first).
+    """
+
+    clusters = []
+    for w in xrange(len(matches)):
+        for cluster in clusters:
+            if matches[cluster[0], w] >= threshold:
+                cluster.append(w)
+                break
+        else:
+            clusters.append([w])
+
+    return clusters
+
+def cluster_simulations(simulations, index, threshold):
+    """
+    Leader clusters (see leader_clusters) of the simulations in simulations
+    (a nrburst_utils.simulation_details), as indices into
+    simulations.simulations.  Simulations missing from the index form their
+    own clusters.
+    """
+
+    rows = dict([(name, r) for r, name in enumerate(index['wavefiles'])])
+
+    indexed = []
+    clusters = []
+    for w, sim in enumerate(simulations.simulations):
+        name = os.path.basename(sim['wavefile'])
+        if name in rows:
+            indexed.append(w)
+        else:
+            clusters.append([w])
+
+    index_rows = [rows[os.path.basename(simulations.simulations[w]['wavefile'])]
+            for w in indexed]
+    matches = index['matches'][np.ix_(index_rows, index_rows)]
+
+    clusters += [[indexed[c] for c in cluster] for cluster in
+            leader_clusters(matches, threshold)]
+
+    return clusters
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Building the index
+
+def parser():
+
+    # --- Command line input
+    parser = OptionParser(usage="%prog [options] catalog_dir")
+    parser.add_option("-o", "--output-file", type=str, default=None)
+    parser.add_option("-m", "--reference-mass", type=float, default=None)
+    parser.add_option("--sample-rate", type=int, default=1024)
+    parser.add_option("--f-min", type=float, default=30.0)
+    parser.add_option("--asd-file", type=str, default=None)
+    parser.add_option("--threshold", type=float, default=0.97,
+            help="report the number of clusters at this match")
+
+    (opts,args) = parser.parse_args()
+
+    if len(args)==0:
+        print >> sys.stderr, "ERROR: require catalog directory"
+        sys.exit(-1)
+
+    if opts.output_file is None:
+        opts.output_file = index_file(args[0])
+
+    return opts, args
+
+def main():
+
+    opts, args = parser()
+
+    delta_t = 1./opts.sample_rate
+
+    simulations = nrbu.simulation_details(catdir=args[0])
+
+    matches, reference_mass, wavefiles = build_index(simulations,
+            reference_mass=opts.reference_mass, delta_t=delta_t,
+            f_min=opts.f_min, asd_file=opts.asd_file, verbose=True)
+
+    save_index(opts.output_file, matches, wavefiles, reference_mass,
+            delta_t, opts.f_min)
+
+    clusters = leader_clusters(matches, opts.threshold)
+
+    print >> sys.stdout, "Reference mass: %.2f"%reference_mass
+    print >> sys.stdout, "%d/%d simulations indexed, in %d clusters at "\
+            "match %.3f"%(len(wavefiles), simulations.nsimulations,
+                    len(clusters), opts.threshold)
+    print >> sys.stdout, "Index written to %s"%opts.output_file
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
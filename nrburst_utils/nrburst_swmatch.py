@@ -31,6 +31,8 @@ import timeit
 
 import lal
 import nrburst_utils as nrbu
+import nrburst_fitfactor as nrbu_ff
+import nrburst_asc2npy as nrbu_npy
 
 import pycbc.filter
 import pycbc.types
@@ -59,51 +61,15 @@ config = nrbu.configuration(cp)
 # --- Reconstruction data
 #
 #print >> sys.stdout,  "Loading data"
-h1_reconstruction_data = np.loadtxt(config.h1_reconstruction)
-h1_asd_data = np.loadtxt(config.h1_spectral_estimate)
-l1_reconstruction_data = np.loadtxt(config.l1_reconstruction)
-l1_asd_data = np.loadtxt(config.l1_spectral_estimate)
+h1_reconstruction_data = nrbu_npy.load(config.h1_reconstruction)
+l1_reconstruction_data = nrbu_npy.load(config.l1_reconstruction)
 
 rec_ext_params = np.loadtxt(config.extrinsic_params)
 
 # If BayesWave, select the user-specified number of samples for which we will
 # compute matches (useful for speed / development work)
-if config.algorithm=='BW':
-
-    if config.nsampls != 'all':
-
-        # Load sampled waveforms
-        #print 'reducing sample size'
-        idx = np.random.random_integers(low=0,
-                high=len(h1_reconstruction_data)-1,
-                size=config.nsampls)
-
-        h1_reconstruction_data = h1_reconstruction_data[idx]
-        l1_reconstruction_data = l1_reconstruction_data[idx]
-
-    elif opts.max_sample is not None:
-
-        #print "selecting out samples %d:%d"%(opts.min_sample, opts.max_sample)
-        idx = range(opts.min_sample, opts.max_sample+1)
-
-        h1_reconstruction_data = h1_reconstruction_data[idx]
-        l1_reconstruction_data = l1_reconstruction_data[idx]
-
-    #else:
-        #print 'using ALL BW samples (%d)'%len(h1_reconstruction_data)
-
-    setattr(config, 'nsampls', len(h1_reconstruction_data))
-
-
-elif config.algorithm=='CWB':
-
-    h1_reconstruction_data = [nrbu.extract_wave(h1_reconstruction_data,
-        config.datalen, config.sample_rate)]
-
-    l1_reconstruction_data = [nrbu.extract_wave(l1_reconstruction_data,
-        config.datalen, config.sample_rate)]
-
-    setattr(config, 'nsampls', 1)
+h1_reconstruction_data, l1_reconstruction_data = nrbu_ff.select_samples(
+        [h1_reconstruction_data, l1_reconstruction_data], config, opts)
 
 
 # Useful time/freq samples
@@ -114,10 +80,10 @@ freq_axis = np.arange(0.5*config.datalen/config.delta_t+1./config.datalen) * 1./
 # end up with a PSD which overs all frequencies for use in the match calculation
 # later - In practice, this will really just pad out the spectrum at low
 # frequencies)
-h1_asd = np.exp(np.interp(np.log(freq_axis), np.log(h1_asd_data[:,0]),
-    np.log(h1_asd_data[:,1])))
-l1_asd = np.exp(np.interp(np.log(freq_axis), np.log(l1_asd_data[:,0]),
-    np.log(l1_asd_data[:,1])))
+h1_asd = np.sqrt(nrbu.get_psd(config.h1_spectral_estimate, 1./config.datalen,
+    len(freq_axis), interpolation='log').numpy())
+l1_asd = np.sqrt(nrbu.get_psd(config.l1_spectral_estimate, 1./config.datalen,
+    len(freq_axis), interpolation='log').numpy())
 
 
 # Load the Software Injection
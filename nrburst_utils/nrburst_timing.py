@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_timing.py
+
+Lightweight per-stage timers and counters for the match calculations.
+
+Stages are timed with a context manager and accumulate per process:
+
+    import nrburst_timing as nrbu_timing
+
+    with nrbu_timing.timer('get_wf_pols/generate'):
+        hp, hc = get_td_waveform(...)
+
+    nrbu_timing.count('fmin/evaluations', result[3])
+
+Stage names are '/'-separated, so 'get_wf_pols' includes
+'get_wf_pols/generate'; times are wall-clock and inclusive.
+
+Instrumentation is disabled by default, in which case timer() returns a
+shared do-nothing context manager and count() returns immediately.  Enable it
+with configure() (e.g., from the --timing option in nrburst_utils.parser()) or
+by setting the environment variable NRBURST_TIMING.  report() prints the call
+counts, totals and percentiles of each stage and write_json() writes them to a
+sidecar file.
+
+Each stage keeps a running call count, total and maximum and a fixed-size
+reservoir sample of its durations, from which the percentiles are estimated,
+so memory use does not grow with the number of calls.
+"""
+
+import os
+import sys
+import json
+import random
+import timeit
+
+import numpy as np
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+_config = {'enabled':False}
+
+# Statistics of each stage and the counters, for this process
+_timings = {}
+_counters = {}
+
+__timing_percentiles__ = [50, 90, 99]
+
+# Number of durations kept per stage for the percentile estimates
+__reservoir_size__ = 1000
+
+_rng = random.Random(0)
+
+class _stage_stats:
+    """
+    Running call count, total and maximum duration of a stage and a uniform
+    reservoir sample of its durations
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reservoir = []
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if self.calls <= __reservoir_size__:
+            self.reservoir.append(elapsed)
+        else:
+            # Algorithm R: keep each duration with probability size/calls
+            i = _rng.randint(0, self.calls-1)
+            if i < __reservoir_size__:
+                self.reservoir[i] = elapsed
+
+class _null_timer:
+    """
+    Context manager which does nothing (instrumentation disabled)
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        return False
+
+_null = _null_timer()
+
+class _stage_timer:
+    """
+    Context manager adding the wall-clock time spent in its block to stage
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = timeit.default_timer() - self.start
+        try:
+            _timings[self.stage].add(elapsed)
+        except KeyError:
+            _timings[self.stage] = _stage_stats()
+            _timings[self.stage].add(elapsed)
+        return False
+
+def configure(enabled=True):
+    """
+    Enable (or disable) the timers and counters
+    """
+    _config['enabled'] = bool(enabled)
+
+def enabled():
+    """
+    True if instrumentation is enabled
+    """
+    return _config['enabled']
+
+def timer(stage):
+    """
+    Context manager timing its block as stage
+    """
+    if not _config['enabled']:
+        return _null
+    return _stage_timer(stage)
+
+def count(name, n=1):
+    """
+    Add n to the counter name
+    """
+    if not _config['enabled']:
+        return
+    _counters[name] = _counters.get(name, 0) + n
+
+def reset():
+    """
+    Discard all timings and counts
+    """
+    _timings.clear()
+    _counters.clear()
+    _rng.seed(0)
+
+def summary():
+    """
+    Return a dictionary of per-stage statistics (calls, total, mean, max and
+    the percentiles in __timing_percentiles__, in seconds) and the counters.
+    Percentiles are exact up to __reservoir_size__ calls and estimated from
+    the reservoir sample beyond that.
+    """
+
+    stages = dict()
+    for stage, stats in _timings.items():
+        stages[stage] = {'calls':stats.calls, 'total':float(stats.total),
+                'mean':float(stats.total/stats.calls),
+                'max':float(stats.max)}
+        for percentile in __timing_percentiles__:
+            stages[stage]['p%d'%percentile] = float(np.percentile(
+                stats.reservoir, percentile))
+
+    return {'stages':stages, 'counters':dict(_counters)}
+
+def report(stream=sys.stdout):
+    """
+    Print the per-stage timing summary to stream
+    """
+
+    if not _timings and not _counters:
+        return
+
+    stats = summary()
+
+    print >> stream, "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
+    print >> stream, "Timing summary (inclusive wall-clock seconds):"
+    print >> stream, "%-36s %8s %10s %10s %10s %10s %10s"%("stage", "calls",
+            "total", "mean", "p50", "p90", "p99")
+    for stage in sorted(stats['stages'].keys()):
+        s = stats['stages'][stage]
+        print >> stream, "%-36s %8d %10.3f %10.2e %10.2e %10.2e %10.2e"%(stage,
+                s['calls'], s['total'], s['mean'], s['p50'], s['p90'],
+                s['p99'])
+
+    if stats['counters']:
+        print >> stream, "Counters:"
+        for name in sorted(stats['counters'].keys()):
+            print >> stream, "%-36s %8d"%(name, stats['counters'][name])
+
+def write_json(filename):
+    """
+    Write the timing summary to the JSON file filename
+    """
+
+    f = open(filename, 'w')
+    json.dump(summary(), f, indent=2, sort_keys=True)
+    f.close()
+
+# Configuration from the environment
+if os.environ.get('NRBURST_TIMING'):
+    configure(True)
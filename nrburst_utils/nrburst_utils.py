@@ -30,6 +30,7 @@ from optparse import OptionParser
 import ConfigParser
 import glob
 import operator
+import collections
 
 import h5py
 
@@ -47,6 +48,11 @@ from pycbc.detector import Detector
 
 from matplotlib import pyplot as pl
 
+import nrburst_wfcache as nrbu_wfcache
+import nrburst_timing as nrbu_timing
+import nrburst_profile as nrbu_profile
+import nrburst_windows as nrbu_win
+
 __author__ = "James Clark <james.clark@ligo.org>"
 #git_version_id = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
 #__version__ = "git id %s" % git_version_id
@@ -80,8 +86,7 @@ def extract_wave(inwave, datalen=4.0, sample_rate = 4096):
 
     extracted = inwave[int(peakidx-0.5*nsamp): int(peakidx+0.5*nsamp)]
 
-    win = lal.CreateTukeyREAL8Window(len(extracted), 0.1)
-    extracted *= win.data.data
+    extracted *= nrbu_win.tukey_window(len(extracted), 0.1)
 
     output = np.zeros(datalen*sample_rate)
     output[0.5*datalen*sample_rate-0.5*nsamp:
@@ -301,13 +306,14 @@ def matchboxes(matches, simulations, Nwaves):
     """
 
     # Find the sorting to present highest matches first.  Sort on median of the
-    # match distribution
-    median_matches = np.median(matches, axis=1)
+    # match distribution (samples skipped by early stopping are NaN)
+    median_matches = np.nanmedian(matches, axis=1)
     match_sort = np.argsort(median_matches)
 
     # --- Match vs Waveform boxes
     f, ax = pl.subplots(figsize=(12,16))
-    match_box = ax.boxplot(matches[match_sort].T, whis='range', showcaps=True,
+    match_box = ax.boxplot([m[~np.isnan(m)] for m in matches[match_sort]],
+            whis='range', showcaps=True,
             showmeans=True, showfliers=False,
             vert=False)
     ax.set_xlabel('Fitting Factor')
@@ -494,62 +500,246 @@ def totspin_dot_L(mass_ratio, spin1x, spin1y, spin1z, spin2x, spin2y, spin2z):
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Match calculations
+# Noise spectra
 
+# Process-wide caches of the ascii ASD data (keyed by file and mtime) and the
+# interpolated PSDs (keyed by file, mtime, delta_f, length and interpolation)
+_asd_data_cache = {}
+_psd_cache = {}
+_psd_cache_stats = {'hits':0, 'misses':0}
 
-def get_wf_pols(file, mtotal, inclination=0.0, delta_t=1./1024, f_lower=30,
-        distance=100):
+def _load_asd_data(noise_file, mtime):
+
+    key = (noise_file, mtime)
+    try:
+        return _asd_data_cache[key]
+    except KeyError:
+        asd_data = np.loadtxt(noise_file)
+        _asd_data_cache[key] = asd_data
+        return asd_data
+
+def get_psd(noise_file, delta_f, flen, interpolation='linear'):
     """
-    Generate the NR_hdf5_pycbc waveform from the HDF5 file <file> with specified
-    params
+    Return the PSD from the two-column (frequency, ASD) ascii file noise_file
+    as a FrequencySeries of length flen and spacing delta_f.
+
+    The ASD is interpolated in frequency (interpolation='linear') or in
+    log(ASD) vs log(frequency) (interpolation='log').  PSDs are cached for the
+    life of the process so the same (file, grid, interpolation) is only
+    computed once; the FrequencySeries is shared between callers so it should
+    not be modified in place.
     """
 
-    f = h5py.File(file, 'r')
+    if interpolation not in ['linear', 'log']:
+        print >> sys.stderr, "ERROR: PSD interpolation must be linear or log"
+        sys.exit(-1)
+
+    noise_file = os.path.abspath(noise_file)
+    mtime = os.path.getmtime(noise_file)
 
+    key = (noise_file, mtime, float(delta_f), int(flen), interpolation)
 
-    # Metadata parameters:
+    try:
+        psd = _psd_cache[key]
+        _psd_cache_stats['hits'] += 1
+        return psd
+    except KeyError:
+        _psd_cache_stats['misses'] += 1
 
-    params = {}
-    params['mtotal'] = mtotal
+    asd_data = _load_asd_data(noise_file, mtime)
+
+    sample_frequencies = np.arange(int(flen)) * delta_f
+
+    if interpolation == 'linear':
+        asd = np.interp(sample_frequencies, asd_data[:,0], asd_data[:,1])
+    else:
+        with np.errstate(divide='ignore'):
+            asd = np.exp(np.interp(np.log(sample_frequencies),
+                np.log(asd_data[:,0]), np.log(asd_data[:,1])))
+
+    psd = pycbc.types.FrequencySeries(asd**2, delta_f=delta_f)
+    _psd_cache[key] = psd
+
+    return psd
+
+def psd_cache_info():
+    """
+    Dictionary of PSD cache statistics: hits, misses and size (number of
+    cached PSDs)
+    """
+    info = dict(_psd_cache_stats)
+    info['size'] = len(_psd_cache)
+    return info
+
+def clear_psd_cache():
+    """
+    Empty the PSD cache and reset its statistics
+    """
+    _psd_cache.clear()
+    _asd_data_cache.clear()
+    _psd_cache_stats['hits'] = 0
+    _psd_cache_stats['misses'] = 0
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Match calculations
+
+
+# Per-process cache of the NR file attributes used by get_wf_pols, keyed by
+# (path, mtime)
+__wf_metadata_attrs__ = ['eta', 'spin1x', 'spin1y', 'spin1z', 'spin2x',
+        'spin2y', 'spin2z', 'coa_phase']
+_wf_metadata_cache = {}
+
+# Optional in-memory memo of generated templates, keyed by (path, mtotal,
+# inclination, delta_t, f_lower, distance), least recently used first.
+# Disabled (maxsize 0) by default; see configure_template_memo().
+_wf_memo = collections.OrderedDict()
+_wf_memo_config = {'maxsize':0}
+_wf_memo_stats = {'hits':0, 'misses':0}
+
+def configure_template_memo(maxsize):
+    """
+    Keep up to maxsize generated templates in memory (0 disables the memo)
+    """
+    _wf_memo_config['maxsize'] = int(maxsize)
+    while len(_wf_memo) > _wf_memo_config['maxsize']:
+        _wf_memo.popitem(last=False)
 
-    params['eta'] = f.attrs['eta']
+def template_memo_info():
+    """
+    Dictionary of template memo statistics: hits, misses, size and maxsize
+    """
+    info = dict(_wf_memo_stats)
+    info['size'] = len(_wf_memo)
+    info['maxsize'] = _wf_memo_config['maxsize']
+    return info
 
-    params['mass1'] = pnutils.mtotal_eta_to_mass1_mass2(params['mtotal'], params['eta'])[0]
-    params['mass2'] = pnutils.mtotal_eta_to_mass1_mass2(params['mtotal'], params['eta'])[1]
+def clear_template_memo():
+    """
+    Empty the template memo and reset its statistics
+    """
+    _wf_memo.clear()
+    _wf_memo_stats['hits'] = 0
+    _wf_memo_stats['misses'] = 0
 
-    params['spin1x'] = f.attrs['spin1x']
-    params['spin1y'] = f.attrs['spin1y']
-    params['spin1z'] = f.attrs['spin1z']
-    params['spin2x'] = f.attrs['spin2x']
-    params['spin2y'] = f.attrs['spin2y']
-    params['spin2z'] = f.attrs['spin2z']
+def get_wf_metadata(file):
+    """
+    Return a dictionary of the attributes in __wf_metadata_attrs__ for the NR
+    HDF5 file <file>.  The file is read once per process (or again if it is
+    modified).
+    """
 
-    params['coa_phase'] = f.attrs['coa_phase']
+    key = (os.path.abspath(file), os.path.getmtime(file))
+
+    try:
+        return _wf_metadata_cache[key]
+    except KeyError:
+        f = h5py.File(file, 'r')
+        metadata = dict([(attr, f.attrs[attr]) for attr in
+            __wf_metadata_attrs__])
+        f.close()
+        _wf_metadata_cache[key] = metadata
+        return metadata
+
+def get_wf_pols(file, mtotal, inclination=0.0, delta_t=1./1024, f_lower=30,
+        distance=100):
+    """
+    Generate the NR_hdf5_pycbc waveform from the HDF5 file <file> with specified
+    params
 
-    f.close()
+    If the on-disk waveform cache is enabled (see nrburst_wfcache), previously
+    generated waveforms are loaded from there instead.  If the template memo
+    is enabled (see configure_template_memo), recently generated waveforms
+    are also kept in memory.
+    """
 
-    hp, hc = get_td_waveform(approximant='NR_hdf5_pycbc', 
-                                     numrel_data=file,
-                                     mass1=params['mass1'],
-                                     mass2=params['mass2'],
-                                     spin1x=params['spin1x'],
-                                     spin1y=params['spin1y'],
-                                     spin1z=params['spin1z'],
-                                     spin2x=params['spin2x'],
-                                     spin2y=params['spin2y'],
-                                     spin2z=params['spin2z'],
-                                     delta_t=delta_t,
-                                     f_lower=f_lower,
-                                     inclination=inclination,
-                                     coa_phase=params['coa_phase'],
-                                     distance=distance)
+    nrbu_timing.count('get_wf_pols/calls')
 
+    if _wf_memo_config['maxsize'] > 0:
+        memo_key = (os.path.abspath(file), float(mtotal), float(inclination),
+                float(delta_t), float(f_lower), float(distance))
+        try:
+            hp_data, hc_data, epoch = _wf_memo.pop(memo_key)
+            _wf_memo[memo_key] = (hp_data, hc_data, epoch)
+            _wf_memo_stats['hits'] += 1
+            # New TimeSeries: callers resize the templates in place
+            hp_tapered = pycbc.types.TimeSeries(np.copy(hp_data),
+                    delta_t=delta_t, epoch=lal.LIGOTimeGPS(epoch))
+            hc_tapered = pycbc.types.TimeSeries(np.copy(hc_data),
+                    delta_t=delta_t, epoch=lal.LIGOTimeGPS(epoch))
+            return hp_tapered, hc_tapered
+        except KeyError:
+            _wf_memo_stats['misses'] += 1
+
+    if nrbu_wfcache.enabled():
+        with nrbu_timing.timer('get_wf_pols/cache_load'):
+            cache_key = nrbu_wfcache.waveform_key(file,
+                    {'mtotal':float(mtotal), 'inclination':float(inclination),
+                        'delta_t':float(delta_t), 'f_lower':float(f_lower),
+                        'distance':float(distance)})
+            cached = nrbu_wfcache.load(cache_key)
+        if cached is not None:
+            nrbu_timing.count('get_wf_pols/cache_hits')
+            hp_data, hc_data, epoch = cached
+            hp_tapered = pycbc.types.TimeSeries(hp_data, delta_t=delta_t,
+                    epoch=lal.LIGOTimeGPS(epoch))
+            hc_tapered = pycbc.types.TimeSeries(hc_data, delta_t=delta_t,
+                    epoch=lal.LIGOTimeGPS(epoch))
+            if _wf_memo_config['maxsize'] > 0:
+                _memoise_template(memo_key, np.copy(hp_data),
+                        np.copy(hc_data), epoch)
+            return hp_tapered, hc_tapered
+
+    # Metadata parameters (from the per-process cache; the file is only opened
+    # the first time)
+    with nrbu_timing.timer('get_wf_pols/metadata'):
+        params = dict(get_wf_metadata(file))
+    params['mtotal'] = mtotal
 
-    hp_tapered = wfutils.taper_timeseries(hp, 'TAPER_START')
-    hc_tapered = wfutils.taper_timeseries(hc, 'TAPER_START')
+    params['mass1'], params['mass2'] = \
+            pnutils.mtotal_eta_to_mass1_mass2(params['mtotal'], params['eta'])
+
+    with nrbu_timing.timer('get_wf_pols/generate'):
+        hp, hc = get_td_waveform(approximant='NR_hdf5_pycbc', 
+                                         numrel_data=file,
+                                         mass1=params['mass1'],
+                                         mass2=params['mass2'],
+                                         spin1x=params['spin1x'],
+                                         spin1y=params['spin1y'],
+                                         spin1z=params['spin1z'],
+                                         spin2x=params['spin2x'],
+                                         spin2y=params['spin2y'],
+                                         spin2z=params['spin2z'],
+                                         delta_t=delta_t,
+                                         f_lower=f_lower,
+                                         inclination=inclination,
+                                         coa_phase=params['coa_phase'],
+                                         distance=distance)
+
+
+    with nrbu_timing.timer('get_wf_pols/taper'):
+        hp_tapered = wfutils.taper_timeseries(hp, 'TAPER_START')
+        hc_tapered = wfutils.taper_timeseries(hc, 'TAPER_START')
+
+    if nrbu_wfcache.enabled():
+        with nrbu_timing.timer('get_wf_pols/cache_store'):
+            nrbu_wfcache.store(cache_key, hp_tapered.numpy(),
+                    hc_tapered.numpy(), float(hp_tapered.start_time))
+
+    if _wf_memo_config['maxsize'] > 0:
+        _memoise_template(memo_key, np.copy(hp_tapered.numpy()),
+                np.copy(hc_tapered.numpy()), float(hp_tapered.start_time))
 
     return hp_tapered, hc_tapered
 
+def _memoise_template(key, hp_data, hc_data, epoch):
+    """
+    Add a template to the in-memory memo, evicting the least recently used
+    """
+    _wf_memo[key] = (hp_data, hc_data, epoch)
+    while len(_wf_memo) > _wf_memo_config['maxsize']:
+        _wf_memo.popitem(last=False)
+
 def project_waveform(hp, hc, skyloc=(0.0, 0.0), polarization=0.0, detector_name="H1"):
     """
     Project the hp,c polarisations onto detector detname for sky location skyloc
@@ -569,22 +759,108 @@ def snr_calc(htilde, stilde, f_min=30.):
     and data
     """
 
-    htilde = pycbc.filter.make_frequency_series(htilde)
-    stilde = pycbc.filter.make_frequency_series(stilde)
+    with nrbu_timing.timer('snr_calc/fft'):
+        htilde = pycbc.filter.make_frequency_series(htilde)
+        stilde = pycbc.filter.make_frequency_series(stilde)
 
+    with nrbu_timing.timer('snr_calc/matched_filter'):
+        snr, corr, snr_norm = pycbc.filter.matched_filter_core(htilde,
+                stilde, psd=None, low_frequency_cutoff=f_min)
 
-    snr, corr, snr_norm = pycbc.filter.matched_filter_core(htilde,
-            stilde, psd=None, low_frequency_cutoff=f_min)
+        maxsnr, max_id = snr.abs_max_loc()
 
-    maxsnr, max_id = snr.abs_max_loc()
-
-    h_sigmasq = pycbc.filter.sigmasq(htilde, low_frequency_cutoff=f_min)
-    d_sigmasq = pycbc.filter.sigmasq(stilde, low_frequency_cutoff=f_min)
+    with nrbu_timing.timer('snr_calc/sigmasq'):
+        h_sigmasq = pycbc.filter.sigmasq(htilde, low_frequency_cutoff=f_min)
+        d_sigmasq = pycbc.filter.sigmasq(stilde, low_frequency_cutoff=f_min)
 
     return maxsnr, h_sigmasq, d_sigmasq
 
+def cutoff_indices(f_min, f_max, delta_f, N):
+    """
+    Return the frequency bin indices [kmin, kmax) bounding f_min and f_max for
+    a length-N time series.  Follows the conventions in pycbc.filter so that
+    band-limited inner products agree with pycbc.filter.match()
+    """
+
+    if f_min:
+        kmin = int(f_min / delta_f)
+    else:
+        kmin = 1
+
+    kmax = int((N + 1)/2.)
+    if f_max:
+        kmax = min(int(f_max / delta_f), kmax)
+
+    return kmin, kmax
+
+def batch_match(htilde, stildes, delta_f, psd=None, f_min=30.0, f_max=None):
+    """
+    Compute the normalised overlap, maximised over time and phase, between
+    the frequency series htilde and each row of stildes.  Equivalent to
+    calling pycbc.filter.match() once per row, but the correlations for all
+    rows are inverse-FFT'd together as a single 2-D transform.
+
+    htilde may be a single frequency series (shared by every row of stildes)
+    or an array with the same shape as stildes.  f_max may be a scalar or an
+    array with one upper cutoff per row.  Frequency series are assumed to
+    hold the non-negative frequencies of an even-length time series.
+    """
+
+    stildes = np.atleast_2d(stildes)
+    nrows, flen = np.shape(stildes)
+    N = 2*(flen-1)
+
+    # Frequency band for each row
+    kmin, _ = cutoff_indices(f_min, None, delta_f, N)
+    if f_max is None:
+        kmax = int((N + 1)/2.) * np.ones(nrows, dtype=int)
+    else:
+        kmax = np.minimum(np.array(np.atleast_1d(f_max) / delta_f, dtype=int),
+                int((N + 1)/2.)) * np.ones(nrows, dtype=int)
+
+    kvals = np.arange(flen)
+    weights = np.array((kvals >= kmin) & (kvals < kmax[:,None]), dtype=float)
+
+    # Noise-weighting
+    if psd is not None:
+        psd = np.asarray(psd)[:flen]
+        inverse_psd = np.zeros(flen)
+        inverse_psd[psd>0] = 1.0 / psd[psd>0]
+        weights *= inverse_psd
+
+    # Complex correlation for positive frequencies; the inverse FFT of this
+    # gives the overlap as a function of time offset, whose modulus is
+    # maximised over phase
+    qtilde = np.zeros(shape=(nrows, N), dtype=complex)
+    qtilde[:,:flen] = np.conj(htilde) * stildes * weights
+    corr = np.fft.ifft(qtilde, axis=1)
+
+    h_sigmasq = 4.0 * delta_f * np.sum(abs(htilde)**2 * weights, axis=1)
+    s_sigmasq = 4.0 * delta_f * np.sum(abs(stildes)**2 * weights, axis=1)
+
+    overlap = 4.0 * delta_f * N * np.max(abs(corr), axis=1)
+
+    return overlap / np.sqrt(h_sigmasq * s_sigmasq)
+
+def batch_timeseries_match(h, s, delta_t, psd=None, f_min=30.0, f_max=None):
+    """
+    Time-domain wrapper for batch_match(): h is a single time series (or one
+    per row of s) and s is an array of time series with one waveform per row.
+    h is Fourier transformed once and all of s in one 2-D FFT.
+    """
+
+    s = np.atleast_2d(s)
+    N = np.shape(s)[1]
+    delta_f = 1.0 / (N*delta_t)
+
+    htilde = np.fft.rfft(h, n=N, axis=-1) * delta_t
+    stildes = np.fft.rfft(s, axis=1) * delta_t
+
+    return batch_match(htilde, stildes, delta_f, psd=psd, f_min=f_min,
+            f_max=f_max)
+
 def single_ifo_match(params, nrfile=None, mass_bounds=None, rec_data=None,
-        asd=None, delta_t=1./1024, f_min=30.0):
+        asd=None, delta_t=1./1024, f_min=30.0, kernel=None):
     """
     Compute mismatch (1-match) between the tmplt wave and the event wave, given
     the total mass.  Uses rec_data and psd which are defined globally in the
@@ -594,20 +870,32 @@ def single_ifo_match(params, nrfile=None, mass_bounds=None, rec_data=None,
     detector response, so that the template waveform is whitened by the ASD
     prior to the match calculation, and no PSD is passed directly to match().
 
+    If kernel (an nrburst_kernel.match_kernel) is given, the overlap is
+    computed with its preplanned FFTs and cached data transform rather than
+    snr_calc().
+
     XXX: Can't i just pass in the config object to get the fixed params
     """
     mtotal, inclination = params
 
     min_mass, max_mass = mass_bounds
 
+    nrbu_timing.count('single_ifo_match/calls')
+
     if (mtotal >= min_mass) and (mtotal <= max_mass):
 
         # Generate the polarisations
         try:
-            tmplt, _ = get_wf_pols(nrfile, mtotal, inclination=inclination, delta_t=delta_t)
+            with nrbu_timing.timer('get_wf_pols'):
+                tmplt, _ = get_wf_pols(nrfile, mtotal, inclination=inclination, delta_t=delta_t)
         except:
+            nrbu_timing.count('get_wf_pols/failures')
             return 0.0, 0.0, 0.0
 
+        if kernel is not None:
+            with nrbu_timing.timer('match_kernel'):
+                return kernel.whitened_snr(tmplt.numpy(), rec_data, asd)
+
         # Put the reconstruction data in a TimeSeries
         rec_data = pycbc.types.TimeSeries(rec_data, delta_t=delta_t)
 
@@ -617,11 +905,13 @@ def single_ifo_match(params, nrfile=None, mass_bounds=None, rec_data=None,
         rec_data.resize(tlen)
 
         # Whiten the template
-        Tmplt = tmplt.to_frequencyseries()
-        Tmplt.data /= asd
+        with nrbu_timing.timer('whiten'):
+            Tmplt = tmplt.to_frequencyseries()
+            Tmplt.data /= asd
 
         # Return the overlap time series and normalisations
-        maxsnr, tmplt_sigmasq, data_sigmasq = snr_calc(Tmplt, rec_data, f_min=30.)
+        with nrbu_timing.timer('snr_calc'):
+            maxsnr, tmplt_sigmasq, data_sigmasq = snr_calc(Tmplt, rec_data, f_min=30.)
 
         return maxsnr, tmplt_sigmasq, data_sigmasq 
 
@@ -632,7 +922,7 @@ def single_ifo_match(params, nrfile=None, mass_bounds=None, rec_data=None,
 
 def network_match(params, nrfile=None, mass_bounds=None, h1_rec_data=None,
         h1_asd=None, l1_rec_data=None, l1_asd=None, delta_t=1./1024,
-        f_min=30.0):
+        f_min=30.0, kernel=None):
     """
     Compute mismatch (1-match) between the tmplt wave and the event wave, given
     the total mass.  Uses rec_data and psd which are defined globally in the
@@ -646,11 +936,11 @@ def network_match(params, nrfile=None, mass_bounds=None, h1_rec_data=None,
 
     h1_max_snr, h1_tmplt_sigmasq, h1_data_sigmasq = single_ifo_match(params,
             nrfile=nrfile, mass_bounds=mass_bounds, rec_data=h1_rec_data,
-            asd=h1_asd, delta_t=delta_t, f_min=f_min)
+            asd=h1_asd, delta_t=delta_t, f_min=f_min, kernel=kernel)
 
     l1_max_snr, l1_tmplt_sigmasq, l1_data_sigmasq = single_ifo_match(params,
             nrfile=nrfile, mass_bounds=mass_bounds, rec_data=l1_rec_data,
-            asd=l1_asd, delta_t=delta_t, f_min=f_min)
+            asd=l1_asd, delta_t=delta_t, f_min=f_min, kernel=kernel)
 
     network_match = h1_max_snr + l1_max_snr
     norm = np.sqrt( (h1_tmplt_sigmasq + l1_tmplt_sigmasq)\
@@ -663,14 +953,14 @@ def network_match(params, nrfile=None, mass_bounds=None, h1_rec_data=None,
 
 def network_mismatch(params, nrfile=None, mass_bounds=None, h1_rec_data=None,
         h1_asd=None, l1_rec_data=None, l1_asd=None, delta_t=1./1024,
-        f_min=30.0):
+        f_min=30.0, kernel=None):
     """
     Scipy optimize wants to minimize a function so use mismatch
     """
 
     return 1-network_match(params, nrfile=nrfile, mass_bounds=mass_bounds,
             h1_rec_data=h1_rec_data, h1_asd=h1_asd, l1_rec_data=l1_rec_data,
-            l1_asd=l1_asd, delta_t=delta_t, f_min=f_min)
+            l1_asd=l1_asd, delta_t=delta_t, f_min=f_min, kernel=kernel)
 
 def network_sw_match(h1_sw_injection, l1_sw_injection,  h1_reconstruction,
         l1_reconstruction, delta_t=1./1024, f_min=30.0):
@@ -721,9 +1011,25 @@ def parser():
     parser.add_option("-w", "--hdf5file", type=str, default=None)
     parser.add_option("--min-sample", type=int, default=0)
     parser.add_option("--max-sample", type=int, default=None)
+    parser.add_option("--prune-margin", type=float, default=None)
+    parser.add_option("--surrogate-nodes", type=int, default=None)
+    parser.add_option("--similarity-threshold", type=float, default=None)
+    parser.add_option("--sample-selection", type="choice",
+            choices=["random", "stratified"], default=None)
+    parser.add_option("--sample-seed", type=int, default=None)
+    parser.add_option("--early-stop-stderr", type=float, default=None)
+    parser.add_option("--timing", default=False, action="store_true")
+    parser.add_option("--timing-file", type=str, default=None)
+    nrbu_profile.add_profile_option(parser)
 
     (opts,args) = parser.parse_args()
 
+    nrbu_profile.start_from_options(opts)
+
+    # Per-stage timers (see nrburst_timing); a timing file implies --timing
+    if opts.timing or opts.timing_file is not None:
+        nrbu_timing.configure(True)
+
     if opts.simulation_number != "all":
         print >> sys.stdout, "Analysis restricted to simulation %s"%(
                 opts.simulation_number)
@@ -749,6 +1055,28 @@ def parser():
         # override from the commandline
         configparser.set('analysis','algorithm',opts.algorithm)
 
+    if opts.prune_margin is not None:
+        configparser.set('analysis','prune-margin',str(opts.prune_margin))
+
+    if opts.surrogate_nodes is not None:
+        configparser.set('analysis','surrogate-nodes',
+                str(opts.surrogate_nodes))
+
+    if opts.similarity_threshold is not None:
+        configparser.set('analysis','similarity-threshold',
+                str(opts.similarity_threshold))
+
+    if opts.sample_selection is not None:
+        configparser.set('parameters','sample-selection',
+                opts.sample_selection)
+
+    if opts.sample_seed is not None:
+        configparser.set('parameters','sample-seed',str(opts.sample_seed))
+
+    if opts.early_stop_stderr is not None:
+        configparser.set('analysis','early-stop-stderr',
+                str(opts.early_stop_stderr))
+
     # Check algorithm is defined (might have been in the ini file)
     if configparser.has_option('analysis', 'algorithm'):
         alg = configparser.get('analysis','algorithm')
@@ -778,11 +1106,61 @@ class configuration:
         self.f_min=configparser.getfloat('analysis', 'f-min')
         self.algorithm=configparser.get('analysis', 'algorithm')
 
+        # Sub-sample refinement of the overlap peak (see nrburst_kernel)
+        try:
+            self.peak_interpolation=configparser.get('analysis',
+                    'peak-interpolation')
+        except:
+            self.peak_interpolation=None
+
+        # Coarse-stage pruning of simulations (see nrburst_fitfactor)
+        try:
+            self.prune_margin=configparser.getfloat('analysis', 'prune-margin')
+        except:
+            self.prune_margin=None
+        try:
+            self.prune_nsamples=configparser.getint('analysis',
+                    'prune-nsamples')
+        except:
+            self.prune_nsamples=1
+
+        # Chebyshev surrogate over mass instead of Nelder-Mead (see
+        # nrburst_fitfactor.surrogate_maximise)
+        try:
+            self.surrogate_nodes=configparser.getint('analysis',
+                    'surrogate-nodes')
+        except:
+            self.surrogate_nodes=None
+
         try:
             self.nsampls=configparser.getint('parameters', 'nsampls')
         except:
             self.nsampls='all'
 
+        # Selection of nsampls samples (see nrburst_fitfactor.select_samples)
+        try:
+            self.sample_selection=configparser.get('parameters',
+                    'sample-selection')
+        except:
+            self.sample_selection='random'
+        try:
+            self.sample_seed=configparser.getint('parameters', 'sample-seed')
+        except:
+            self.sample_seed=None
+
+        # Early stopping on the median fitting factor (see
+        # nrburst_fitfactor.fit_simulation)
+        try:
+            self.early_stop_stderr=configparser.getfloat('analysis',
+                    'early-stop-stderr')
+        except:
+            self.early_stop_stderr=None
+        try:
+            self.early_stop_min_samples=configparser.getint('analysis',
+                    'early-stop-min-samples')
+        except:
+            self.early_stop_min_samples=10
+
 
         self.min_chirp_mass=configparser.getfloat('parameters', 'min-chirp-mass')
         self.max_chirp_mass=configparser.getfloat('parameters', 'max-chirp-mass')
@@ -793,6 +1171,23 @@ class configuration:
         self.l1_spectral_estimate=configparser.get('paths', 'l1_spectral-estimate')
         self.catalog=configparser.get('paths', 'catalog')
 
+        # Clustering with the catalog similarity index (see nrburst_simindex)
+        try:
+            self.similarity_threshold=configparser.getfloat('analysis',
+                    'similarity-threshold')
+        except:
+            self.similarity_threshold=None
+        try:
+            self.similarity_margin=configparser.getfloat('analysis',
+                    'similarity-margin')
+        except:
+            self.similarity_margin=0.05
+        try:
+            self.similarity_index=configparser.get('paths', 'similarity-index')
+        except:
+            self.similarity_index=os.path.join(self.catalog,
+                    'similarity_index.npz')
+
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Waveform catalog Tools
@@ -831,6 +1226,14 @@ class simulation_details:
         print "Bounds: ", param_bounds
         print "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
 
+    def prime_metadata_cache(self):
+        """
+        Read the generation metadata (see get_wf_metadata) for every simulation
+        now, so that get_wf_pols does not need to open the HDF5 files again
+        """
+        for sim in self.simulations:
+            get_wf_metadata(sim['wavefile'])
+
     def list_simulations(self, catdir=None):
         """
         Creates a list of simulation dictionaries which contain the locations
@@ -37,6 +37,7 @@ import pycbc.types
 from pylal import spawaveform
 
 import burst_nr_utils as nrbu
+import nrburst_profile as nrbu_profile
 
 pl.rcParams.update({'axes.labelsize': 16})
 pl.rcParams.update({'xtick.labelsize':16})
@@ -55,9 +56,12 @@ def parser():
     parser.add_option("-l", "--match-clim-low", type=float, default=0.90)
     parser.add_option("-L", "--no-plot", action="store_true", default=False)
     parser.add_option("-a", "--asd-data", type=str)
+    nrbu_profile.add_profile_option(parser)
 
     (opts,args) = parser.parse_args()
 
+    nrbu_profile.start_from_options(opts)
+
     return opts, args
 
 def make_labels(simulations):
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_wfcache.py
+
+Optional on-disk cache of generated NR waveforms, shared between processes
+and script invocations.
+
+Entries are keyed by the SHA1 of the NR HDF5 file contents plus the
+generation parameters, so renaming or copying a catalog does not invalidate
+the cache but changing a file does.  Each entry is a compressed .npz file
+holding both polarisations; the least recently used entries are evicted once
+the cache exceeds its maximum size.
+
+The cache is disabled by default.  Enable it with configure(), or set the
+environment variables
+
+    NRBURST_WAVEFORM_CACHE       cache directory
+    NRBURST_WAVEFORM_CACHE_SIZE  maximum size in MB (default 1024)
+"""
+
+import os
+import glob
+import hashlib
+import tempfile
+
+import numpy as np
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+_config = {'cache_dir':None, 'max_size':1024*1024**2}
+
+# Running estimate of the cache size (bytes; None until the directory has been
+# scanned) and the number of stores since the last scan.  Other processes
+# sharing the cache also add entries, so the directory is rescanned at least
+# every __rescan_stores__ stores.
+_usage = {'size':None, 'stores':0}
+
+__rescan_stores__ = 100
+
+# Eviction frees space down to this fraction of the maximum size, so that a
+# full cache is not rescanned on every store
+__evict_fraction__ = 0.9
+
+# SHA1 of NR file contents, keyed by (path, mtime, size)
+_file_hashes = {}
+
+def configure(cache_dir=None, max_size=1024):
+    """
+    Use cache_dir for the waveform cache (created if necessary), holding at
+    most max_size MB.  cache_dir=None disables the cache.
+    """
+
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    _config['cache_dir'] = cache_dir
+    _config['max_size'] = int(max_size*1024**2)
+
+    _usage['size'] = None
+    _usage['stores'] = 0
+
+def enabled():
+    """
+    True if a cache directory has been configured
+    """
+    return _config['cache_dir'] is not None
+
+def file_hash(filename):
+    """
+    SHA1 of the contents of filename; memoised on the file path, size and
+    modification time
+    """
+
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+    try:
+        return _file_hashes[key]
+    except KeyError:
+        sha = hashlib.sha1()
+        f = open(filename, 'rb')
+        for block in iter(lambda: f.read(1024**2), ''):
+            sha.update(block)
+        f.close()
+        _file_hashes[key] = sha.hexdigest()
+        return _file_hashes[key]
+
+def waveform_key(filename, params):
+    """
+    Cache key for the waveform generated from the NR file filename with the
+    generation parameters in the dictionary params
+    """
+    key = hashlib.sha1(file_hash(filename))
+    key.update(repr(sorted(params.items())))
+    return key.hexdigest()
+
+def _entry(key):
+    return os.path.join(_config['cache_dir'], key + '.npz')
+
+def load(key):
+    """
+    Return (hplus, hcross, epoch) for key, or None if the entry does not exist
+    (or the cache is disabled)
+    """
+
+    if not enabled():
+        return None
+
+    entry = _entry(key)
+
+    try:
+        data = np.load(entry)
+        hplus, hcross, epoch = data['hplus'], data['hcross'], float(data['epoch'])
+        data.close()
+    except (IOError, OSError, KeyError, ValueError):
+        # missing, or evicted / partially written by another process
+        return None
+
+    # Mark as recently used
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+
+    return hplus, hcross, epoch
+
+def store(key, hplus, hcross, epoch):
+    """
+    Store the polarisations for key and evict old entries if the cache is
+    over its maximum size
+    """
+
+    if not enabled():
+        return
+
+    # Write to a temporary file and rename so other processes never read a
+    # partial entry.  The .tmp suffix keeps it out of evict()'s scan.
+    fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=_config['cache_dir'])
+    f = os.fdopen(fd, 'wb')
+    np.savez_compressed(f, hplus=hplus, hcross=hcross, epoch=np.array(epoch))
+    f.close()
+
+    entry = _entry(key)
+    try:
+        size = os.path.getsize(tmpfile)
+        os.rename(tmpfile, entry)
+    except OSError:
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+        return
+
+    # Only scan the directory when the running total says the cache is full
+    # (or periodically, to account for other processes)
+    _usage['stores'] += 1
+    if _usage['size'] is not None:
+        _usage['size'] += size
+
+    if _usage['size'] is None or _usage['size'] > _config['max_size'] or \
+            _usage['stores'] >= __rescan_stores__:
+        evict()
+
+def evict():
+    """
+    If the cache is over its maximum size, remove the least recently used
+    entries until it is within __evict_fraction__ of it.  Resets the running
+    size estimate.
+    """
+
+    if not enabled():
+        return
+
+    entries = []
+    for entry in glob.glob(os.path.join(_config['cache_dir'], '*.npz')):
+        try:
+            stat = os.stat(entry)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total_size = sum([entry[1] for entry in entries])
+
+    if total_size <= _config['max_size']:
+        entries = []
+
+    for mtime, size, entry in sorted(entries):
+        if total_size <= __evict_fraction__*_config['max_size']:
+            break
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+        total_size -= size
+
+    _usage['size'] = total_size
+    _usage['stores'] = 0
+
+# Configuration from the environment
+if os.environ.get('NRBURST_WAVEFORM_CACHE'):
+    configure(os.environ['NRBURST_WAVEFORM_CACHE'],
+            max_size=float(os.environ.get('NRBURST_WAVEFORM_CACHE_SIZE', 1024)))
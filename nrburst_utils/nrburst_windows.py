@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-2016 James Clark <james.clark@ligo.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+nrburst_windows.py
+
+Vectorised window functions for tapering NR and approximant waveforms.
+
+Windows are memoised on their length and shape parameter, so repeated calls
+(e.g., once per mass point) only compute each window once.  The arrays which
+are returned are shared between callers and so are read-only: copy them
+before modifying in place.
+"""
+
+import numpy as np
+
+__author__ = "James Clark <james.clark@ligo.org>"
+
+# Memoised windows, keyed by (window name, N, shape parameter)
+_window_cache = {}
+
+def _cached(name, N, param, builder):
+    """
+    Return the cached window for (name, N, param), building it with
+    builder(N, param) the first time it is requested
+    """
+
+    key = (name, int(N), float(param))
+
+    try:
+        return _window_cache[key]
+    except KeyError:
+        win = builder(int(N), float(param))
+        win.setflags(write=False)
+        _window_cache[key] = win
+        return win
+
+def clear_cache():
+    """
+    Empty the window cache
+    """
+    _window_cache.clear()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Window construction
+
+def _planck_window(N, epsilon):
+
+    t1 = -0.5*N
+    t2 = -0.5*N * (1.-2.*epsilon)
+    t3 = 0.5*N * (1.-2.*epsilon)
+    t4 = 0.5*N
+
+    ts = np.arange(-0.5*N, 0.5*N)
+    win = np.zeros(N)
+
+    rising = (t1<ts) * (ts<t2)
+    flat = (t1<ts) * (t2<=ts) * (ts<=t3)
+    falling = (t3<ts) * (ts<t4)
+
+    # The exponent diverges towards the edges of the taper, where the window
+    # correctly goes to zero
+    with np.errstate(over='ignore', divide='ignore'):
+        t = ts[rising]
+        Zp = (t2-t1)/(t-t1) + (t2-t1)/(t-t2)
+        win[rising] = 1./(np.exp(Zp)+1)
+
+        t = ts[falling]
+        Zm = (t3-t4)/(t-t3) + (t3-t4)/(t-t4)
+        win[falling] = 1./(np.exp(Zm)+1)
+
+    win[flat] = 1.0
+
+    return win
+
+def _tukey_window(N, alpha):
+
+    # As XLALCreateTukeyREAL8Window: sin^2 tapers over the first and last
+    # round(alpha*(N-1)/2) samples, mirrored so the window is symmetric
+    win = np.ones(N)
+
+    transition = int(alpha*(N-1)/2. + 0.5)
+    if N < 2 or transition <= 0:
+        return win
+
+    y = (2.0*np.arange(transition) - (N-1)) / (N-1)
+    win[:transition] = np.sin(0.5*np.pi*(y+1)/alpha)**2
+    win[N-transition:] = win[:transition][::-1]
+
+    return win
+
+def _start_taper(N, epsilon):
+
+    win = np.copy(_planck_window(N, epsilon))
+    win[int(0.5*N):] = 1.0
+
+    return win
+
+def _end_taper(N, epsilon):
+
+    return _start_taper(N, epsilon)[::-1].copy()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Public interface
+
+def planck_window(N, epsilon):
+    """
+    Planck-taper window of length N.  A fraction epsilon of the window rises
+    smoothly from zero at the start, and falls to zero at the end.
+    """
+    return _cached('planck', N, epsilon, _planck_window)
+
+def tukey_window(N, alpha):
+    """
+    Tukey (tapered cosine) window of length N; a fraction alpha of the window
+    lies in the cosine tapers (alpha=0: rectangular, alpha=1: Hann).  Follows
+    the definition of lal.CreateTukeyREAL8Window(N, alpha) but has not been
+    checked against it sample-by-sample, so may differ at the taper edges.
+    """
+    return _cached('tukey', N, alpha, _tukey_window)
+
+def start_taper(N, epsilon):
+    """
+    Planck-taper the start of a length N series only: the first half of the
+    window is planck_window(N, epsilon), the second half is unity
+    """
+    return _cached('start', N, epsilon, _start_taper)
+
+def end_taper(N, epsilon):
+    """
+    Planck-taper the end of a length N series only (start_taper reversed)
+    """
+    return _cached('end', N, epsilon, _end_taper)
+
+def window_wave(input_data, epsilon=0.3, threshold=1e-3):
+    """
+    Taper the start of the non-negligible part of input_data (where
+    |input_data| exceeds threshold times its maximum) with a Planck window.
+    input_data is modified in place and returned.
+    """
+
+    nonzero=np.flatnonzero(abs(input_data)>threshold*max(abs(input_data)))
+    idx = range(nonzero[0],nonzero[-1])
+    input_data[idx] *= start_taper(len(idx), epsilon)
+
+    return input_data
+
@@ -43,6 +43,16 @@ bounds['a2'] = [-0.99, 0.01]
 noise_file = \
         '/home/jclark308/Projects/bhextractor/data/noise_curves/early_aligo.dat'
 
+#
+# --- PCA Configuration
+#
+# pca_method: 'exact', 'randomized' (top ncomponents only) or 'incremental'
+# (streams catalog_file from disk in batches of batch_size rows)
+pca_method = 'exact'
+ncomponents = None
+batch_size = None
+catalog_file = None
+
 #
 # --- Generate initial catalog
 #
@@ -56,10 +66,12 @@ simulations = nrbu.simulation_details(param_bounds=bounds,
         catdir='/home/jclark308/lvc_nr/GaTech')
 
 # Build catalog from HDF5
-catalog = nrbu_pca.catalog(simulations, noise_file=noise_file, mtotal=100)
+catalog = nrbu_pca.catalog(simulations, noise_file=noise_file, mtotal=100,
+        catalog_file=catalog_file)
 
 # Peform PCA
-bbh_pca = nrbu_pca.bbh_pca(catalog)
+bbh_pca = nrbu_pca.bbh_pca(catalog, pca_method=pca_method,
+        ncomponents=ncomponents, batch_size=batch_size)
 
 # Save PCA data
 bbh_pca.file_dump(sys.argv[1])
@@ -118,13 +130,14 @@ ax[1][1].set_xlabel('Time [s]')
 pl.tight_layout()
 
 f, ax = pl.subplots()
-ax.plot(range(1,len(simulations.simulations)+1), np.real(bbh_pca.matches.T),
+npcs = np.shape(bbh_pca.matches)[1]
+ax.plot(range(1,npcs+1), np.real(bbh_pca.matches.T),
         color='grey', alpha=0.5)
 ax.set_xlabel('# PCs')
 ax.set_ylabel('single IFO (H1) Match')
 
-min_matches = [min(np.real(bbh_pca.matches[:,n])) for n in xrange(33)]
-ax.plot(range(1,len(simulations.simulations)+1),min_matches, color='k',
+min_matches = np.min(np.real(bbh_pca.matches), axis=0)
+ax.plot(range(1,npcs+1),min_matches, color='k',
         linestyle='--', linewidth=2)
 ax.set_ylim(0.95,1)
 ax.minorticks_on()
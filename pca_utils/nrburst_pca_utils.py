@@ -21,12 +21,13 @@ bhex_utils.py
 import sys, os
 import os.path
 import subprocess
+import struct
+import hashlib
 import cPickle as pickle
 
 import numpy as np
 import scipy.optimize
-from scipy.spatial.distance import euclidean as euclidean_distance
-from sklearn.decomposition import PCA 
+from sklearn.decomposition import PCA, IncrementalPCA
 
 import lal
 import pycbc.types
@@ -35,46 +36,73 @@ from pycbc.waveform import utils as wfutils
 
 import nrburst_utils as nrbu
 
+# Binary PC basis format: a fixed-size little-endian header followed by a
+# C-contiguous float64 matrix (row 0 is the mean, rows 1: are the PCs).  The
+# header holds: magic, dtype string, nrows, ncols, delta_t, catalog hash
+__basis_magic__ = 'NRBPCS01'
+__basis_header_fmt__ = '<8s8sQQd40s'
+__basis_header_size__ = 128
+
 class catalog:
     """
     Contains attributes of catalog and numpy arrays with feature aligned
     waveforms
     """
     def __init__(self, simulations, mtotal=100.0, nTsamples=1024,
-            delta_t=1./1024, noise_file=None):
+            delta_t=1./1024, noise_file=None, catalog_file=None):
 
-        print "Building catalogue"
         self.simulations = simulations
-        self.amplitude_matrix, self.phase_matrix = build_catalog(simulations,
-                mtotal=mtotal, noise_file=noise_file, nTsamples=nTsamples,
-                delta_t=delta_t)
+        self.mtotal = mtotal
+        self.nTsamples = nTsamples
+        self.delta_t = delta_t
+        self.catalog_hash = catalog_hash(simulations, mtotal=mtotal,
+                nTsamples=nTsamples, delta_t=delta_t, noise_file=noise_file)
+
+        if catalog_file is not None and check_catalog(catalog_file,
+                self.catalog_hash, shape=(simulations.nsimulations,
+                    nTsamples)):
+            # Previously built catalog: map the matrices from disk, rather than
+            # loading them into memory
+            print "Loading catalogue from %s"%catalog_file
+            self.amplitude_matrix, self.phase_matrix = \
+                    load_catalog(catalog_file)
+        else:
+            print "Building catalogue"
+            self.amplitude_matrix, self.phase_matrix = build_catalog(simulations,
+                    mtotal=mtotal, noise_file=noise_file, nTsamples=nTsamples,
+                    delta_t=delta_t, catalog_file=catalog_file)
 
 class bbh_pca:
     """
     Contains the PCA decomposition of an aligned catalog
     """
 
-    def __init__(self, catalog, delta_t=1./1024):
+    def __init__(self, catalog, delta_t=1./1024, pca_method='exact',
+            ncomponents=None, batch_size=None):
 
         self.delta_t = delta_t
+        self.catalog_hash = catalog.catalog_hash
         #
         # --- Peform the PCA decomposition
         #
-        print "Performing PCA"
+        print "Performing PCA (%s)"%pca_method
         self.pca = perform_pca(catalog.amplitude_matrix,
-                catalog.phase_matrix)
+                catalog.phase_matrix, method=pca_method,
+                ncomponents=ncomponents, batch_size=batch_size)
 
         nsims = catalog.simulations.nsimulations
+        npcs = min(self.pca['amplitude_pca'].n_components_,
+                self.pca['phase_pca'].n_components_)
 
         #
         # --- Compute nominal projection coefficients and matches
         #
-        self.amplitude_betas = np.zeros(shape=(nsims,nsims))
-        self.phase_betas = np.zeros(shape=(nsims,nsims))
+        self.amplitude_betas = np.zeros(shape=(nsims,npcs))
+        self.phase_betas = np.zeros(shape=(nsims,npcs))
 
-        self.amplitude_euclidean_distance = np.zeros(shape=(nsims,nsims))
-        self.phase_euclidean_distance = np.zeros(shape=(nsims,nsims))
-        self.matches = np.zeros(shape=(nsims,nsims), dtype=complex)
+        self.amplitude_euclidean_distance = np.zeros(shape=(nsims,npcs))
+        self.phase_euclidean_distance = np.zeros(shape=(nsims,npcs))
+        self.matches = np.zeros(shape=(nsims,npcs), dtype=complex)
 
 
         for w in xrange(nsims):
@@ -82,44 +110,35 @@ class bbh_pca:
             projection = self.project_waveform(catalog.amplitude_matrix[w,:],
                 catalog.phase_matrix[w,:])
 
-            self.amplitude_betas[w,:] = np.copy(projection['amplitude_betas'])
-            self.phase_betas[w,:] = np.copy(projection['phase_betas'])
-
-            for n in xrange(nsims):
-
-
-                # Reconstruct for each number of PCs
-                recamp, recphase = self.reconstruct_ampphase(
-                        catalog.amplitude_matrix[w,:],
-                        catalog.phase_matrix[w,:], npcs=n+1)
-
-                self.amplitude_euclidean_distance[w,n] = euclidean_distance(recamp,
-                        catalog.amplitude_matrix[w,:])
-                self.phase_euclidean_distance[w,n] = euclidean_distance(recphase,
-                        catalog.phase_matrix[w,:])
-
+            self.amplitude_betas[w,:] = np.copy(projection['amplitude_betas'][:npcs])
+            self.phase_betas[w,:] = np.copy(projection['phase_betas'][:npcs])
 
-                # Compute match with hplus
-                hplus = pycbc.types.TimeSeries(np.real(catalog.amplitude_matrix[w,:] *
-                        np.exp(1j*catalog.phase_matrix[w,:])), delta_t=self.delta_t)
-                hplus_rec = \
-                        pycbc.types.TimeSeries(np.real(recamp*np.exp(1j*recphase)),
-                                delta_t=self.delta_t)
+            # Reconstruct for each number of PCs (row n uses n+1 PCs)
+            recamps, recphases = self.reconstruct_all_ampphase(
+                    catalog.amplitude_matrix[w,:], catalog.phase_matrix[w,:],
+                    projection=projection)
+            recamps = recamps[:npcs,:]
+            recphases = recphases[:npcs,:]
 
-                plus_match , _ = pycbc.filter.match(hplus, hplus_rec,
-                        low_frequency_cutoff=30.0, psd=None)
+            self.amplitude_euclidean_distance[w,:] = np.sqrt(np.sum(
+                (recamps - catalog.amplitude_matrix[w,:])**2, axis=1))
+            self.phase_euclidean_distance[w,:] = np.sqrt(np.sum(
+                (recphases - catalog.phase_matrix[w,:])**2, axis=1))
 
-                # Compute match with hcross
-                hcross = pycbc.types.TimeSeries(np.imag(catalog.amplitude_matrix[w,:] *
-                        np.exp(1j*catalog.phase_matrix[w,:])), delta_t=self.delta_t)
-                hcross_rec = \
-                        pycbc.types.TimeSeries(np.imag(recamp*np.exp(1j*recphase)),
-                                delta_t=self.delta_t)
-                cross_match , _ = pycbc.filter.match(hcross, hcross_rec,
-                        low_frequency_cutoff=30.0, psd=None)
+            # Matches with hplus and hcross for every truncation: the
+            # original waveform is FFT'd once and all reconstructions together
+            complex_wave = catalog.amplitude_matrix[w,:] * \
+                    np.exp(1j*catalog.phase_matrix[w,:])
+            complex_recs = recamps * np.exp(1j*recphases)
 
+            plus_matches = nrbu.batch_timeseries_match(np.real(complex_wave),
+                    np.real(complex_recs), delta_t=self.delta_t, f_min=30.0,
+                    psd=None)
+            cross_matches = nrbu.batch_timeseries_match(np.imag(complex_wave),
+                    np.imag(complex_recs), delta_t=self.delta_t, f_min=30.0,
+                    psd=None)
 
-                self.matches[w,n] = plus_match + 1j*cross_match
+            self.matches[w,:] = plus_matches + 1j*cross_matches
 
 
 
@@ -130,9 +149,49 @@ class bbh_pca:
 
         projection = dict()
         projection['amplitude_betas'] = \
-                np.concatenate(self.pca['amplitude_pca'].transform(amplitude))
+                np.concatenate(self.pca['amplitude_pca'].transform(
+                    np.atleast_2d(amplitude)))
         projection['phase_betas'] =  \
-                np.concatenate(self.pca['phase_pca'].transform(phase))
+                np.concatenate(self.pca['phase_pca'].transform(
+                    np.atleast_2d(phase)))
+
+        return projection
+
+    def project_batch(self, amplitudes, phases, npcs=None, align=False):
+        """
+        Project a batch of waveforms onto the first npcs PCs (default: all).
+        amplitudes and phases are (N, nTsamples) arrays, already converted to
+        amplitude/phase and peak-aligned (or set align=True to align them with
+        align_to_peak()).
+
+        Returns a dictionary with the (N, npcs) arrays of amplitude_betas and
+        phase_betas, and the euclidean distance between each waveform and its
+        npcs-PC reconstruction (amplitude_residual, phase_residual).  Since the
+        PCs are orthonormal, the residual follows from the betas directly,
+        so the whole batch costs one matrix multiply per basis.
+        """
+
+        amplitudes = np.atleast_2d(amplitudes)
+        phases = np.atleast_2d(phases)
+
+        if align:
+            amplitudes, phases = align_to_peak(amplitudes, phases,
+                    nTsamples=np.shape(self.pca['amplitude_pca'].mean_)[0])
+
+        projection = dict()
+
+        for name, data in [('amplitude', amplitudes), ('phase', phases)]:
+
+            pcaObj = self.pca[name+'_pca']
+
+            centered = data - pcaObj.mean_
+            betas = np.dot(centered, pcaObj.components_[:npcs,:].T)
+
+            residual_sq = np.sum(centered**2, axis=1) - np.sum(betas**2, axis=1)
+            residual_sq[residual_sq<0] = 0.0
+
+            projection[name+'_betas'] = betas
+            projection[name+'_residual'] = np.sqrt(residual_sq)
 
         return projection
 
@@ -144,19 +203,11 @@ class bbh_pca:
         # Get projection
         projection = self.project_waveform(amplitude, phase)
 
-        rec_amplitude = np.zeros(shape=np.shape(amplitude))
-        rec_phase = np.zeros(shape=np.shape(phase))
-
         # Sum contributions from PCs
-        for i in xrange(npcs):
-
-            rec_amplitude += \
-                    projection['amplitude_betas'][i]*\
-                    self.pca['amplitude_pca'].components_[i,:]
-
-            rec_phase += \
-                    projection['phase_betas'][i]*\
-                    self.pca['phase_pca'].components_[i,:]
+        rec_amplitude = np.dot(projection['amplitude_betas'][:npcs],
+                self.pca['amplitude_pca'].components_[:npcs,:])
+        rec_phase = np.dot(projection['phase_betas'][:npcs],
+                self.pca['phase_pca'].components_[:npcs,:])
 
         # De-center the reconstruction
         rec_amplitude += self.pca['amplitude_pca'].mean_
@@ -164,9 +215,35 @@ class bbh_pca:
 
         return rec_amplitude, rec_phase
 
-    def file_dump(self, pcs_filename=None):
+    def reconstruct_all_ampphase(self, amplitude, phase, projection=None):
+        """
+        Reconstruct the amplitude and phase data using every number of PCs at
+        once: row n of the returned arrays is the reconstruction from the first
+        n+1 PCs.  The waveform is projected once and the truncated sums are
+        built with a cumulative sum over the weighted components.
+        """
+
+        # Get projection (unless we already have it)
+        if projection is None:
+            projection = self.project_waveform(amplitude, phase)
+
+        # Cumulative sum of the weighted PCs
+        rec_amplitudes = np.cumsum(projection['amplitude_betas'][:,None] *
+                self.pca['amplitude_pca'].components_, axis=0)
+        rec_phases = np.cumsum(projection['phase_betas'][:,None] *
+                self.pca['phase_pca'].components_, axis=0)
+
+        # De-center the reconstructions
+        rec_amplitudes += self.pca['amplitude_pca'].mean_
+        rec_phases += self.pca['phase_pca'].mean_
+
+        return rec_amplitudes, rec_phases
+
+    def file_dump(self, pcs_filename=None, ascii=False):
         """
-        Dump to binary for LAL
+        Dump to binary for LAL.  Each basis is written to
+        <pcs_filename>_<pca_attr>.basis (see write_pca_basis); set ascii=True
+        to also write the (slow) <pcs_filename>_<pca_attr>.asc text dump
         """
 
         if pcs_filename is None:
@@ -174,20 +251,10 @@ class bbh_pca:
 file dumps"
             sys.exit(-1)
 
-        #
-        # Ascii Dump
-        #
         for pca_attr in self.pca.keys():
             
             pcaObj = self.pca[pca_attr]
 
-            #
-            # Ascii
-            #
-            this_name_asc  = os.path.join(pcs_filename + "_" + pca_attr +
-                    ".asc")
-            print "Dumping to %s"%this_name_asc
-
             # First row contains the mean waveform
             dims = np.shape(pcaObj.components_)
             output_array  = np.zeros(shape=(dims[0]+1,dims[1]))
@@ -195,55 +262,255 @@ file dumps"
             output_array[0,:]  = pcaObj.mean_
             output_array[1:,:] = pcaObj.components_
 
-            np.savetxt(this_name_asc, output_array)
-
             #
             # Binary
             #
             this_name_bin  = os.path.join(pcs_filename + "_" + pca_attr +
-                    ".dat")
+                    ".basis")
             print "Dumping to %s"%this_name_bin
 
-            fp = open(this_name_bin, "wb")
-            output_array.tofile(fp)
-            fp.close()
+            write_pca_basis(this_name_bin, output_array, delta_t=self.delta_t,
+                    catalog_hash=self.catalog_hash)
+
+            #
+            # Ascii
+            #
+            if ascii:
+                this_name_asc  = os.path.join(pcs_filename + "_" + pca_attr +
+                        ".asc")
+                print "Dumping to %s"%this_name_asc
+
+                np.savetxt(this_name_asc, output_array)
 
         return 0
 
 
 
-def perform_pca(amplitudes, phases):
+def catalog_hash(simulations, mtotal=100.0, nTsamples=1024, delta_t=1./1024,
+        noise_file=None):
+    """
+    SHA1 hex digest identifying the simulations and settings used to build a
+    catalog; stored in PC basis headers so bases can be traced to catalogs
+    """
+
+    sha = hashlib.sha1()
+    for sim in simulations.simulations:
+        sha.update(os.path.basename(sim['wavefile']))
+    sha.update('%r %r %r %r'%(mtotal, nTsamples, delta_t,
+        None if noise_file is None else os.path.basename(noise_file)))
+
+    return sha.hexdigest()
+
+def write_pca_basis(filename, data, delta_t=1./1024, catalog_hash=''):
+    """
+    Write the matrix data (mean + PCs) to filename in the binary basis format:
+    a __basis_header_size__ byte header followed by the contiguous float64
+    data, so the file can be memory-mapped or fread() directly from C
+    """
+
+    data = np.ascontiguousarray(data, dtype='<f8')
+    nrows, ncols = np.shape(data)
+
+    header = struct.pack(__basis_header_fmt__, __basis_magic__,
+            data.dtype.str, nrows, ncols, delta_t, catalog_hash)
+    header += '\0' * (__basis_header_size__ - len(header))
+
+    fp = open(filename, "wb")
+    fp.write(header)
+    data.tofile(fp)
+    fp.close()
+
+    return 0
+
+def read_pca_basis_header(filename):
+    """
+    Return the header of a binary basis file as a dictionary
+    """
+
+    fp = open(filename, "rb")
+    header = fp.read(struct.calcsize(__basis_header_fmt__))
+    fp.close()
+
+    magic, dtype, nrows, ncols, delta_t, digest = \
+            struct.unpack(__basis_header_fmt__, header)
+
+    if magic != __basis_magic__:
+        print >> sys.stderr, "ERROR: %s is not a PC basis file"%filename
+        sys.exit(-1)
+
+    return {'dtype':dtype.rstrip('\0'), 'shape':(nrows, ncols),
+            'delta_t':delta_t, 'catalog_hash':digest.rstrip('\0')}
+
+def load_pca_basis(filename, mode='r'):
+    """
+    Memory-map a binary basis file written by write_pca_basis.  Returns the
+    header dictionary and a (zero-copy) np.memmap of the data, whose first row
+    is the mean and remaining rows the PCs
+    """
+
+    header = read_pca_basis_header(filename)
+
+    data = np.memmap(filename, dtype=header['dtype'], mode=mode,
+            offset=__basis_header_size__, shape=header['shape'])
+
+    return header, data
+
+
+def perform_pca(amplitudes, phases, method='exact', ncomponents=None,
+        batch_size=None):
     """
     Do PCA with ampnitude and phase parts of the complex waveforms in complex_catalogue
+
+    method selects the decomposition:
+        'exact':        full SVD of the data matrices (the default)
+        'randomized':   randomized SVD retaining only the leading ncomponents
+        'incremental':  incremental PCA, fit batch_size rows at a time.  The
+                        rows are only read when they are needed, so the
+                        matrices can be memory-mapped catalogs which do not fit
+                        in memory (see build_catalog)
     """
 
-    amp_pca = PCA()
-    amp_pca.fit(amplitudes)
+    methods = ['exact', 'randomized', 'incremental']
+    if method not in methods:
+        print >> sys.stderr, "ERROR: PCA method %s not recognised"%method
+        print >> sys.stderr, "must be in ", methods
+        sys.exit(-1)
 
-    phase_pca = PCA()
-    phase_pca.fit(phases)
+    if method != 'exact' and ncomponents is None:
+        print >> sys.stderr, "ERROR: %s PCA requires ncomponents"%method
+        sys.exit(-1)
 
     pca={}
 
-    pca['amplitude_pca'] = amp_pca
-    pca['phase_pca'] = phase_pca
+    for pca_attr, data in [('amplitude_pca', amplitudes), ('phase_pca', phases)]:
+
+        if method == 'exact':
+
+            pcaObj = PCA(n_components=ncomponents)
+            pcaObj.fit(data)
+
+        elif method == 'randomized':
+
+            pcaObj = PCA(n_components=ncomponents, svd_solver='randomized')
+            pcaObj.fit(data)
+
+        elif method == 'incremental':
+
+            pcaObj = IncrementalPCA(n_components=ncomponents)
+
+            for start, end in _batch_bounds(len(data), batch_size, ncomponents):
+                pcaObj.partial_fit(np.array(data[start:end]))
+
+        pca[pca_attr] = pcaObj
 
 
     return pca
 
+def _batch_bounds(nrows, batch_size, min_batch):
+    """
+    Return (start, end) row indices for batches of batch_size rows.  A short
+    final batch is merged into the one before it, since every incremental PCA
+    batch needs at least min_batch rows
+    """
+
+    if batch_size is None:
+        batch_size = 5*min_batch
+    batch_size = max(batch_size, min_batch)
+
+    starts = range(0, nrows, batch_size)
+    if len(starts) > 1 and nrows - starts[-1] < min_batch:
+        starts = starts[:-1]
+
+    ends = starts[1:] + [nrows]
+
+    return zip(starts, ends)
+
+def check_catalog(catalog_file, catalog_hash, shape):
+    """
+    True if the matrices written by build_catalog() to catalog_file exist,
+    were built for catalog_hash (see catalog_hash()) and have the given
+    shape; a stale or incomplete catalog is reported and must be rebuilt
+    """
+
+    files = [catalog_file + suffix for suffix in ["_amplitude.npy",
+        "_phase.npy", "_hash.txt"]]
+    if not all([os.path.exists(f) for f in files]):
+        return False
+
+    stored_hash = open(catalog_file + "_hash.txt", 'r').read().strip()
+    amp_cat, phase_cat = load_catalog(catalog_file)
+
+    if stored_hash != catalog_hash or np.shape(amp_cat) != shape or \
+            np.shape(phase_cat) != shape:
+        print "Catalogue in %s does not match the simulations / settings, "\
+                "rebuilding"%catalog_file
+        return False
+
+    return True
+
+def load_catalog(catalog_file):
+    """
+    Memory-map the amplitude and phase matrices written by build_catalog()
+    """
 
+    amp_cat = np.load(catalog_file + "_amplitude.npy", mmap_mode='r')
+    phase_cat = np.load(catalog_file + "_phase.npy", mmap_mode='r')
+
+    return amp_cat, phase_cat
+
+def align_to_peak(amplitudes, phases, nTsamples=1024):
+    """
+    Align each row of amplitudes (and phases) so that the peak amplitude sits
+    at sample nTsamples/2, zero-padding (or truncating) either side.  This is
+    the centring convention used for the catalog in build_catalog().
+    Returns (N, nTsamples) arrays.
+    """
+
+    amplitudes = np.atleast_2d(amplitudes)
+    phases = np.atleast_2d(phases)
+    nwaves, nsamples = np.shape(amplitudes)
+
+    peakidx = np.argmax(amplitudes, axis=1)
+
+    # Destination column of every input sample
+    cols = np.arange(nsamples)[None,:] - peakidx[:,None] + int(0.5*nTsamples)
+    rows = np.arange(nwaves)[:,None] * np.ones(nsamples, dtype=int)
+    valid = (cols>=0) * (cols<nTsamples)
+
+    aligned_amp = np.zeros(shape=(nwaves, nTsamples))
+    aligned_phase = np.zeros(shape=(nwaves, nTsamples))
+
+    aligned_amp[rows[valid], cols[valid]] = amplitudes[valid]
+    aligned_phase[rows[valid], cols[valid]] = phases[valid]
+
+    return aligned_amp, aligned_phase
 
 def build_catalog(simulations, mtotal=100.0, nTsamples=1024, delta_t=1./1024,
-        noise_file=None):
+        noise_file=None, catalog_file=None):
 
     """
-    Build the data matrix.
+    Build the data matrix.  If catalog_file is given, the matrices are written
+    straight to <catalog_file>_amplitude.npy and <catalog_file>_phase.npy and
+    returned as memory-maps, so the catalog need not fit in memory.  The
+    catalog_hash() of the simulations and settings is written to
+    <catalog_file>_hash.txt once the matrices are complete.
     """
 
 
     # Preallocation
-    amp_cat = np.zeros(shape=(simulations.nsimulations, nTsamples))
-    phase_cat = np.zeros(shape=(simulations.nsimulations, nTsamples))
+    if catalog_file is None:
+        amp_cat = np.zeros(shape=(simulations.nsimulations, nTsamples))
+        phase_cat = np.zeros(shape=(simulations.nsimulations, nTsamples))
+    else:
+        # Invalidate any previous catalog until these matrices are complete
+        if os.path.exists(catalog_file + "_hash.txt"):
+            os.remove(catalog_file + "_hash.txt")
+        amp_cat = np.lib.format.open_memmap(catalog_file + "_amplitude.npy",
+                mode='w+', dtype=float,
+                shape=(simulations.nsimulations, nTsamples))
+        phase_cat = np.lib.format.open_memmap(catalog_file + "_phase.npy",
+                mode='w+', dtype=float,
+                shape=(simulations.nsimulations, nTsamples))
 
     for s, sim in enumerate(simulations.simulations):
         
@@ -336,19 +603,21 @@ def build_catalog(simulations, mtotal=100.0, nTsamples=1024, delta_t=1./1024,
 #       pl.show()
 #       sys.exit()
         
-        # POPULATE
-        # right
-        start = 0.5*nTsamples
-        end = start+len(amp.data)-peakidx
-        amp_cat[s, start:end] = np.copy(amp.data[peakidx:])
-        phase_cat[s, start:end] = np.copy(phase.data[peakidx:])
-
-        # left
-        start = 0.5*nTsamples-peakidx
-        end = 0.5*nTsamples
-        amp_cat[s, start:end] = np.copy(amp.data[:peakidx])
-        phase_cat[s, start:end] = np.copy(phase.data[:peakidx])
+        # POPULATE (peak amplitude at the center)
+        aligned_amp, aligned_phase = align_to_peak(amp.data, phase.data,
+                nTsamples=nTsamples)
+        amp_cat[s, :] = aligned_amp[0,:]
+        phase_cat[s, :] = aligned_phase[0,:]
+
+
+    if catalog_file is not None:
+        amp_cat.flush()
+        phase_cat.flush()
 
+        f = open(catalog_file + "_hash.txt", 'w')
+        f.write(catalog_hash(simulations, mtotal=mtotal, nTsamples=nTsamples,
+            delta_t=delta_t, noise_file=noise_file) + '\n')
+        f.close()
 
     return (amp_cat, phase_cat)
 